@@ -5,13 +5,14 @@
 import os
 import sys
 import click
-import shutil
 import errorhandler
 import iac_init.validator
 
 from . import options
 from iac_init.conf import settings
 from iac_init.yaml_conf import yaml_writer
+from iac_init.scripts.copy_tool import copy_file
+from iac_init.scripts.device_tool import reimage_apics, reimage_switches
 from iac_init.scripts.thread_tool import MyThread
 from iac_init.scripts.ansible_tool import ansible_deploy_function
 from iac_init.scripts.logging_tool import setup_logging
@@ -22,15 +23,19 @@ error_handler = errorhandler.ErrorHandler()
 @click.command(context_settings=dict(help_option_names=["-h", "--help"]))
 @click.version_option(iac_init.__version__)
 @options.yaml_dir_path
+@options.no_cache
 def main(
-        data: str
+        data: str,
+        no_cache: bool
 ) -> None:
     """A CLI tool to bootstrap and configure ACI fabric using ACI as Code."""
     output = settings.OUTPUT_BASE_DIR
+    settings.YAML_DISK_CACHE = not no_cache
+    settings.VALIDATION_MANIFEST = not no_cache
+    settings.TEMPLATE_BYTECODE_CACHE = not no_cache
 
-    if os.path.exists(output) and os.path.isdir(output):
-        shutil.rmtree(output)
-
+    # The working directory is generated incrementally, files of earlier
+    # runs and the logs are kept.
     logger = setup_logging()
 
     logger.info("Start to process aac-init tool!")
@@ -69,6 +74,10 @@ def main(
     for option in option_choice:
         logger.info("Start processing step {}.".format(option))
         if int(option) in [1]:
+            error = validator.validate_tcp_reachability(
+                cimc=True, console=True)
+            if error:
+                exit()
             error = validator.validate_ssh_telnet_connection()
             if error:
                 exit()
@@ -86,67 +95,43 @@ def main(
                 logger.info(f"Generate step {option} working directory"
                             f"in {output} successfully")
 
-                dir_path = os.path.join(
-                    output,
-                    os.path.basename(settings.TEMPLATE_DIR[int(option)-1]),
-                    'aci_switch_reimage',
-                    'vars'
-                )
-                if os.path.exists(dir_path) and os.path.isdir(dir_path):
-                    yaml_cp_output_path = os.path.join(dir_path, 'main.yml')
-                    shutil.copy(yaml_path, yaml_cp_output_path)
-                    logger.info("Copied switch YAML file to {} successfully."
-                                .format(yaml_cp_output_path))
-
-                dir_path = os.path.join(
-                    output,
-                    os.path.basename(settings.TEMPLATE_DIR[int(option)-1]),
-                    'apic_reimage',
-                    'vars'
-                )
-                if os.path.exists(dir_path) and os.path.isdir(dir_path):
-                    yaml_cp_output_path = os.path.join(dir_path, 'main.yml')
-                    shutil.copy(yaml_path, yaml_cp_output_path)
-                    logger.info("Copied APIC YAML file to {} successfully."
-                                .format(yaml_cp_output_path))
-
             except Exception as e:
                 msg = f"Generate working directory failed.\nDetail: {e}"
                 logger.error(msg)
                 exit()
 
             try:
-                playbook_dir_apic = os.path.join(
-                    os.getcwd(),
-                    output,
-                    os.path.basename(settings.TEMPLATE_DIR[int(option)-1]),
-                    "playbook_apic_init.yaml"
-                )
-
-                playbook_dir_switch = os.path.join(
+                working_dir = os.path.join(
                     os.getcwd(),
                     output,
-                    os.path.basename(settings.TEMPLATE_DIR[int(option)-1]),
-                    "playbook_aci_switch_init.yaml"
+                    os.path.basename(settings.TEMPLATE_DIR[int(option)-1])
                 )
 
+                # Each APIC and switch reimages through its own pipeline,
+                # devices in parallel
                 thread1 = MyThread(
-                    target=ansible_deploy_function,
+                    target=reimage_apics,
                     args=(
-                        playbook_dir_apic,
-                        settings.ANSIBLE_STEP[0],
-                        option,
-                        None,
-                        True)
+                        writer.data["fabric"],
+                        working_dir,
+                        os.path.join(
+                            output,
+                            'iac_init_log',
+                            'iac_init_{}_{}'.format(
+                                option, settings.ANSIBLE_STEP[0])
+                        ))
                 )
                 thread2 = MyThread(
-                    target=ansible_deploy_function,
+                    target=reimage_switches,
                     args=(
-                        playbook_dir_switch,
-                        settings.ANSIBLE_STEP[1],
-                        option,
-                        None,
-                        True)
+                        writer.data["fabric"]["switch_nodes_connection"],
+                        working_dir,
+                        os.path.join(
+                            output,
+                            'iac_init_log',
+                            'iac_init_{}_{}'.format(
+                                option, settings.ANSIBLE_STEP[1])
+                        ))
                 )
 
                 logger.info("ACI fabric bootstrap in progress, "
@@ -169,12 +154,15 @@ def main(
                     exit()
 
             except Exception as e:
-                msg = "Run Step 1 ACI fabric bootstrap ansible-playbook" \
-                      " failed.\nDetail: {}".format(e)
+                msg = "Run Step 1 ACI fabric bootstrap failed." \
+                      "\nDetail: {}".format(e)
                 logger.error(msg)
                 exit()
 
         elif int(option) in [2]:
+            error = validator.validate_tcp_reachability(cimc=True)
+            if error:
+                exit()
             yaml_path = validator.validate_yaml_exist(
                 settings.DEFAULT_DATA_PATH
             )
@@ -199,10 +187,13 @@ def main(
                 )
                 if os.path.exists(dir_path) and os.path.isdir(dir_path):
                     yaml_cp_output_path = os.path.join(dir_path, 'main.yml')
-                    shutil.copy(yaml_path, yaml_cp_output_path)
+                    # User data is never hardlinked
+                    method = copy_file(yaml_path, yaml_cp_output_path,
+                                       ["reflink", "copy"])
+                    writer.track(output, yaml_cp_output_path)
                     logger.info(
-                        "Copied APIC YAML file to {} successfully."
-                        .format(yaml_cp_output_path)
+                        "Copied APIC YAML file to {} successfully ({})."
+                        .format(yaml_cp_output_path, method)
                     )
 
             except Exception as e:
@@ -238,6 +229,12 @@ def main(
                 exit()
 
         elif int(option) in [3]:
+            # APICs are still booting right after step 2,
+            # leave them to the AAA login poller.
+            if "2" not in option_choice:
+                error = validator.validate_tcp_reachability(apic=True)
+                if error:
+                    exit()
             error = validator.validate_apic_aaa_connection()
             if error:
                 exit()
@@ -278,6 +275,7 @@ def main(
                     )
                     if not result:
                         exit()
+                    writer.track(output, yaml_cp_output_path)
 
             except Exception as e:
                 msg = "Generate working directory failed.\nDetail: {}"\
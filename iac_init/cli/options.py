@@ -11,3 +11,10 @@ yaml_dir_path = click.option(
     required=True,
     help='Path to data YAML files.'
 )
+
+no_cache = click.option(
+    '--no-cache',
+    is_flag=True,
+    default=False,
+    help='Do not use the on-disk cache of previous runs.'
+)
@@ -43,3 +43,120 @@ ANSIBLE_STEP = [
     'aac_deploy',
     'aac_test'
 ]
+
+# Preflight SSH/Telnet validation: maximum concurrent probes and per-host
+# deadlines in seconds.
+PREFLIGHT_MAX_WORKERS = 16
+SSH_TIMEOUT = 300
+TELNET_TIMEOUT = 10
+
+# APIC AAA login readiness polling: shared deadline, exponential backoff
+# base/cap and single HTTPS request timeout, all in seconds.
+APIC_LOGIN_TIMEOUT = 900
+APIC_LOGIN_BACKOFF = 3
+APIC_LOGIN_BACKOFF_MAX = 60
+APIC_REQUEST_TIMEOUT = 30
+
+# Maximum number of CIMCs pre-checked in parallel
+CIMC_PRECHECK_MAX_WORKERS = 8
+
+# CIMC XML API request timeout in seconds, and the fraction of the login
+# cookie refresh period after which the cookie is refreshed.
+CIMC_REQUEST_TIMEOUT = 60
+CIMC_COOKIE_REFRESH_RATIO = 0.8
+
+# Fraction of the APIC token refreshTimeoutSeconds after which the token
+# is refreshed through aaaRefresh.
+APIC_TOKEN_REFRESH_RATIO = 0.8
+
+# TCP reachability prescan before credentialed checks: connect timeout in
+# seconds, attempts per host:port and maximum concurrent connections.
+PRESCAN_TIMEOUT = 0.5
+PRESCAN_ATTEMPTS = 2
+PRESCAN_MAX_CONNECTIONS = 256
+
+# CIMC fault severities failing the pre-check (e.g. ["critical"]), and
+# whether to keep the raw faultInst response as a gzip log artifact.
+CIMC_FAULT_FAIL_SEVERITIES = []
+CIMC_FAULT_ARTIFACT = False
+
+# On-disk cache of parsed YAML data, keyed by file content and tool
+# version. Disabled with --no-cache.
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+    "iac_init"
+)
+YAML_DISK_CACHE = True
+
+# Parse YAML files in this many processes when at least
+# YAML_PARALLEL_LOAD_THRESHOLD files have to be parsed.
+YAML_LOAD_PROCESSES = os.cpu_count() or 1
+YAML_PARALLEL_LOAD_THRESHOLD = 64
+
+# Load YAML into plain data with the safe loader (libyaml based when
+# ruamel.yaml.clib is installed), round-trip only where YAML is written.
+YAML_FAST_LOAD = True
+
+# Skip validating data files unchanged since the last run, using a
+# manifest in CACHE_DIR. Disabled with --no-cache.
+VALIDATION_MANIFEST = True
+
+# Render templates of a step with this many workers, in a "thread" or
+# "process" pool.
+RENDER_WORKERS = os.cpu_count() or 1
+RENDER_POOL = "thread"
+
+# Keep compiled templates in CACHE_DIR. Disabled with --no-cache.
+TEMPLATE_BYTECODE_CACHE = True
+
+# Per-device expect scripts YamlWriter renders for each step, the
+# playbooks only execute them. Entries are (template, device list in
+# "fabric", script), relative to the templates and output dir of the step.
+# {major} is the major version of the APIC image, {hostname} the hostname
+# of the device.
+DEVICE_SCRIPTS = {
+    "01-wipe_aci_fabric": [
+        ("aci_switch_reimage/templates/aci_switch_reimage.exp.jinja2",
+         "switch_nodes_connection",
+         "aci_switch_reimage_{hostname}.exp"),
+        ("aci_switch_reimage/templates/"
+         "aci_switch_reimage_post_check.exp.jinja2",
+         "switch_nodes_connection",
+         "aci_switch_reimage_post_check_{hostname}.exp"),
+        ("apic_reimage/templates/apic_reimage{major}.exp.jinja2",
+         "apic_nodes_connection",
+         "apic_reimage_{hostname}.exp"),
+        ("apic_reimage/templates/apic_reimage_post_check.exp.jinja2",
+         "apic_nodes_connection",
+         "apic_reimage_post_check_{hostname}.exp"),
+    ],
+    "02-discover_apic": [
+        ("apic_discovery/templates/apic_discovery{major}.exp.jinja2",
+         "apic_nodes_connection",
+         "apic_discovery/files/apic_discovery_{hostname}.exp"),
+    ],
+}
+
+# Ways to place static template files in the working directory, tried
+# in order until one works. "reflink" and "hardlink" only apply within a
+# filesystem. A hardlinked file shares its content with the installed
+# template, so only add "hardlink" if the templates are read-only. User
+# data is never hardlinked. Files are copied if none works.
+STATIC_FILE_METHODS = ["reflink", "copy"]
+
+# Expect interpreter running the per-device scripts
+EXPECT_PATH = "/usr/bin/expect"
+
+# Switch reimage: maximum switches reimaged in parallel and deadline in
+# seconds of each reimage and post check script.
+SWITCH_REIMAGE_MAX_WORKERS = 16
+SWITCH_REIMAGE_TIMEOUT = 7200
+
+# APIC reimage: maximum APICs reimaged in parallel and deadline in seconds
+# of the whole pipeline of an APIC, from CIMC configuration to post check.
+APIC_REIMAGE_MAX_WORKERS = 8
+APIC_REIMAGE_TIMEOUT = 10800
+
+# CIMC XML API request timeout in seconds while configuring an APIC CIMC
+# for reimage, capped by what is left of APIC_REIMAGE_TIMEOUT.
+CIMC_CONFIG_TIMEOUT = 500
@@ -2,9 +2,14 @@
 
 # Copyright: (c) 2024, Wang Xiao <xiawang3@cisco.com>
 
-import requests
 import json
+import time
+import random
+import asyncio
+import requests
 import urllib3
+from iac_init.conf import settings
+from iac_init.utils.exceptions import ApicApiError
 from iac_init.scripts.logging_tool import setup_logging
 
 logger = setup_logging()
@@ -14,79 +19,245 @@ urllib3.disable_warnings(
 )
 
 
-def get_health_status(APIC_IP, token):
-    try:
-        headers = {
-            'accept': 'application/json',
-            'Content-Type': 'application/json',
-            'Cookie': f'APIC-cookie={token}'
-        }
-        apic_health_url = f"https://{APIC_IP}/api/node/class/infraWiNode.json"
-        response = requests.get(
-            url=apic_health_url,
-            headers=headers,
-            verify=False
-        )
-        if response.status_code == 200:
-            health_status = []
-            return_data = response.json()
-            for item in return_data['imdata']:
-                health_status.append(
-                    item['infraWiNode']['attributes']['health']
-                )
-            for status in health_status:
-                if status != "fully-fit":
-                    msg = "APIC {} Health Check failed(Not fully-fit)!"\
-                        .format(APIC_IP)
-                    logger.error(msg)
-                    return False
-            return True
-        else:
-            return False
-    except Exception as e:
-        msg = "{}".format(e)
-        logger.error(msg)
-        return False
+class ApicClient:
+    """
+    APIC REST client logging in once over a pooled HTTPS session.
 
+    The APIC-cookie token is refreshed through aaaRefresh before its
+    refreshTimeoutSeconds runs out, and re-created once on 401/403.
+    """
 
-# Rudy: discuss AAA domain later
-def apic_login(APIC_IP, APIC_USERNAME, APIC_PASSWORD):
-    try:
-        apic_login_url = f"https://{APIC_IP}/api/aaaLogin.json"
-        headers = {
+    def __init__(self, APIC_IP, APIC_USERNAME, APIC_PASSWORD):
+        self.ip = APIC_IP
+        self.username = APIC_USERNAME
+        self.password = APIC_PASSWORD
+        self.base_url = f"https://{APIC_IP}/api"
+        self.session = requests.Session()
+        self.session.verify = False
+        self.session.headers.update({
             'accept': 'application/json',
             'Content-Type': 'application/json',
-        }
+        })
+        self.token = None
+        self.refresh_timeout = 0
+        self.token_time = 0
 
+    def close(self):
+        self.session.close()
+
+    def _set_token(self, response, method):
+        if response.status_code != 200:
+            raise ApicApiError(
+                "APIC {} {} failed(not 200 response)!".format(
+                    self.ip, method),
+                status=response.status_code
+            )
+        attributes = response.json()["imdata"][0][method]["attributes"]
+        if not attributes.get("token"):
+            raise ApicApiError(
+                "APIC {} connected failed(no token)!".format(self.ip))
+        self.token = attributes["token"]
+        self.refresh_timeout = int(
+            attributes.get("refreshTimeoutSeconds") or 0)
+        self.token_time = time.monotonic()
+        # The session cookie jar already holds APIC-cookie from the
+        # response, keep the explicit header for older releases.
+        self.session.headers['Cookie'] = f'APIC-cookie={self.token}'
+
+    def login(self):
         data = {
             "aaaUser": {
                 "attributes": {
-                    "name": APIC_USERNAME,
-                    "pwd": APIC_PASSWORD
+                    "name": self.username,
+                    "pwd": self.password
                 }
             }
         }
-        response = requests.post(
-            url=apic_login_url,
-            headers=headers,
+        response = self.session.post(
+            url=f"{self.base_url}/aaaLogin.json",
             data=json.dumps(data),
-            verify=False
+            timeout=settings.APIC_REQUEST_TIMEOUT
         )
+        self._set_token(response, "aaaLogin")
+        return self.token
 
-        if response.status_code == 200:
-            res_json = response.json()
-            token = res_json["imdata"][0]["aaaLogin"]["attributes"]["token"]
-            if token:
-                return get_health_status(APIC_IP, token)
-            else:
-                msg = "APIC {} connected failed(no token)!".format(APIC_IP)
-                logger.error(msg)
-                return False
-        else:
-            msg = "APIC {} connected failed(not 200 response)!".format(APIC_IP)
+    def refresh(self):
+        response = self.session.get(
+            url=f"{self.base_url}/aaaRefresh.json",
+            timeout=settings.APIC_REQUEST_TIMEOUT
+        )
+        self._set_token(response, "aaaRefresh")
+        return self.token
+
+    def _ensure_token(self):
+        if not self.token:
+            self.login()
+        elif self.refresh_timeout and \
+                time.monotonic() - self.token_time > \
+                self.refresh_timeout * settings.APIC_TOKEN_REFRESH_RATIO:
+            try:
+                self.refresh()
+            except (ApicApiError, ValueError, LookupError) as e:
+                # The APIC rebooted or purged the session, login again
+                logger.info("APIC {} token refresh failed, login again: {}"
+                            .format(self.ip, e))
+                self.token = None
+                self.login()
+
+    def get(self, path, params=None):
+        """GET an API path (e.g. /node/class/fvTenant.json) as JSON."""
+        self._ensure_token()
+        response = self.session.get(
+            url=f"{self.base_url}{path}",
+            params=params,
+            timeout=settings.APIC_REQUEST_TIMEOUT
+        )
+        if response.status_code in (401, 403):
+            # Token expired or was revoked, login again and retry once.
+            self.login()
+            response = self.session.get(
+                url=f"{self.base_url}{path}",
+                params=params,
+                timeout=settings.APIC_REQUEST_TIMEOUT
+            )
+        if response.status_code != 200:
+            raise ApicApiError(
+                "APIC {} GET {} failed(not 200 response)!".format(
+                    self.ip, path),
+                status=response.status_code
+            )
+        return response.json()
+
+    def query_class(
+            self,
+            class_name,
+            query_filter=None,
+            rsp_subtree=None,
+            page_size=None,
+            max_items=None,
+            **params
+    ):
+        """
+        Query a class, optionally narrowed by query-target-filter and
+        rsp-subtree, and paged through with page/page-size.
+
+        Returns (imdata, totalCount). Paging stops after max_items
+        objects, so callers only interested in a few objects don't pull
+        the whole class.
+        """
+        if query_filter:
+            params["query-target-filter"] = query_filter
+        if rsp_subtree:
+            params["rsp-subtree"] = rsp_subtree
+        if page_size:
+            params["page-size"] = page_size
+
+        path = f"/node/class/{class_name}.json"
+        imdata = []
+        page = 0
+        while True:
+            if page_size:
+                params["page"] = page
+            result = self.get(path, params)
+            total_count = int(result.get("totalCount", 0))
+            imdata += result["imdata"]
+            if not page_size or not result["imdata"] \
+                    or len(imdata) >= total_count \
+                    or (max_items and len(imdata) >= max_items):
+                return imdata, total_count
+            page += 1
+
+
+def get_health_status(client):
+    try:
+        # Only fetch the APIC(s) which are not fully-fit
+        _, total_count = client.query_class(
+            "infraWiNode",
+            query_filter='ne(infraWiNode.health,"fully-fit")',
+            page_size=1,
+            max_items=1
+        )
+        if total_count:
+            msg = "APIC {} Health Check failed(Not fully-fit)!"\
+                .format(client.ip)
             logger.error(msg)
             return False
+        return True
+    except Exception as e:
+        msg = "{}".format(e)
+        logger.error(msg)
+        return False
+
+
+# Rudy: discuss AAA domain later
+def apic_login(APIC_IP, APIC_USERNAME, APIC_PASSWORD, client=None):
+    close = client is None
+    if client is None:
+        client = ApicClient(APIC_IP, APIC_USERNAME, APIC_PASSWORD)
+    try:
+        if not client.token:
+            client.login()
+        return get_health_status(client)
     except Exception as e:
         msg = "{}".format(e)
         logger.error(msg)
         return False
+    finally:
+        if close:
+            client.close()
+
+
+async def _wait_apic_ready(APIC_IP, APIC_USERNAME, APIC_PASSWORD, deadline):
+    loop = asyncio.get_running_loop()
+    # One client per APIC, its session and token are reused by every attempt
+    client = ApicClient(APIC_IP, APIC_USERNAME, APIC_PASSWORD)
+    attempt = 1
+    try:
+        while True:
+            connection_state = await asyncio.to_thread(
+                apic_login, APIC_IP, APIC_USERNAME, APIC_PASSWORD, client
+            )
+            if connection_state:
+                logger.info("APIC {} Login successfully after {} attempt(s)."
+                            .format(APIC_IP, attempt))
+                return True
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                logger.error("APIC {} Login timeout after {} attempt(s)!"
+                             .format(APIC_IP, attempt))
+                return False
+
+            # Exponential backoff with jitter, capped and bounded
+            # by the deadline shared with the other APICs.
+            delay = min(
+                settings.APIC_LOGIN_BACKOFF_MAX,
+                settings.APIC_LOGIN_BACKOFF * 2 ** (attempt - 1)
+            )
+            delay = min(random.uniform(delay / 2, delay), remaining)
+            logger.info("Attempt to validate {} APIC Login Connection {}th, "
+                        "retry in {:.1f}s, {:.0f}s left."
+                        .format(APIC_IP, attempt, delay, remaining))
+            attempt += 1
+            await asyncio.sleep(delay)
+    finally:
+        client.close()
+
+
+def wait_apic_cluster_ready(APIC_LIST, APIC_USERNAME, APIC_PASSWORD, timeout):
+    """
+    Poll every APIC concurrently until it accepts AAA login and reports
+    fully-fit, or until the shared timeout expires.
+
+    Returns a dict of APIC address to readiness state.
+    """
+
+    async def _wait_all():
+        deadline = asyncio.get_running_loop().time() + timeout
+        result = await asyncio.gather(*[
+            _wait_apic_ready(ip, APIC_USERNAME, APIC_PASSWORD, deadline)
+            for ip in APIC_LIST
+        ])
+        return dict(zip(APIC_LIST, result))
+
+    return asyncio.run(_wait_all())
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Wang Xiao <xiawang3@cisco.com>
+
+import os
+import stat
+from typing import IO
+
+from iac_init.conf import settings
+
+
+def _check_owner(path: str, path_stat: os.stat_result) -> None:
+    if hasattr(os, "getuid") and path_stat.st_uid != os.getuid():
+        raise PermissionError(
+            "{} is not owned by the current user".format(path))
+
+
+def cache_dir(*parts: str) -> str:
+    """
+    Directory parts below CACHE_DIR, created if missing.
+
+    CACHE_DIR and every directory below it must be owned by the current
+    user and are restricted to it (mode 0700), so nobody else can plant
+    cache files read by the next run.
+    """
+    paths = [settings.CACHE_DIR]
+    for part in parts:
+        paths.append(os.path.join(paths[-1], part))
+    for path in paths:
+        try:
+            os.makedirs(path, mode=0o700)
+        except FileExistsError:
+            pass
+        path_stat = os.lstat(path)
+        if not stat.S_ISDIR(path_stat.st_mode):
+            raise NotADirectoryError(
+                "{} is not a directory".format(path))
+        _check_owner(path, path_stat)
+        if path_stat.st_mode & 0o077:
+            os.chmod(path, 0o700)
+    return paths[-1]
+
+
+def check_cache_file(file: IO) -> None:
+    """Raise if the open cache file is not owned by the current user."""
+    _check_owner(file.name, os.fstat(file.fileno()))
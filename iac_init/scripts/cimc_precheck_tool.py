@@ -2,113 +2,385 @@
 
 # Copyright: (c) 2024, Rudy Lei <shlei@cisco.com>
 
-import re
+import os
+import gzip
+import time
 import urllib3
+import threading
 import requests
 import xml.etree.ElementTree as ET
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import quoteattr
 
+from iac_init.conf import settings
+from iac_init.utils.exceptions import CimcApiError
 from iac_init.scripts.logging_tool import setup_logging
 
 logger = setup_logging()
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# XML API error code returned for a missing or expired login cookie
+AUTH_ERROR_CODES = ("552",)
 
-def cimc_api(CIMC_IP, data):
-    try:
-        cimc_url = f"https://{CIMC_IP}/nuova"
-        headers = {
+
+class CimcClient:
+    """
+    CIMC XML API client keeping one keep-alive HTTPS session per CIMC.
+
+    The login cookie is refreshed through aaaRefresh before its refresh
+    period runs out, and re-created once if the CIMC rejects it.
+    """
+
+    def __init__(self, CIMC_IP, CIMC_USERNAME, CIMC_PASSWORD, timeout=None):
+        self.ip = CIMC_IP
+        self.username = CIMC_USERNAME
+        self.password = CIMC_PASSWORD
+        self.url = f"https://{CIMC_IP}/nuova"
+        self.session = requests.Session()
+        self.session.verify = False
+        self.session.headers.update({
             'accept': '*/*',
             'Content-Type': 'text/html',
-        }
-
-        response = requests.post(
-            url=cimc_url,
-            headers=headers,
+        })
+        self.timeout = settings.CIMC_REQUEST_TIMEOUT \
+            if timeout is None else timeout
+        self.cookie = None
+        self.refresh_period = 0
+        self.cookie_time = 0
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        self.login()
+        return self
+
+    def __exit__(self, *exc):
+        self.logout()
+        self.session.close()
+
+    def post(self, data):
+        """Post a raw XML API request, return the parsed response root."""
+        response = self.session.post(
+            url=self.url,
             data=data,
-            verify=False
+            timeout=self.timeout
+        )
+        if response.status_code != 200:
+            raise CimcApiError(f"APIC CIMC {self.ip} connected failed!")
+        root = ET.fromstring(response.content)
+        if root.get('errorCode'):
+            raise CimcApiError(
+                "APIC CIMC {} {} failed: {}".format(
+                    self.ip, root.tag, root.get('errorDescr')),
+                code=root.get('errorCode')
+            )
+        return root
+
+    def _set_cookie(self, root):
+        self.cookie = root.get('outCookie')
+        if not self.cookie:
+            raise CimcApiError(f"CIMC {self.ip} Login failed!")
+        self.refresh_period = int(root.get('outRefreshPeriod') or 0)
+        self.cookie_time = time.monotonic()
+
+    def login(self):
+        root = self.post(
+            "<aaaLogin inName={} inPassword={}></aaaLogin>".format(
+                quoteattr(self.username), quoteattr(self.password))
+        )
+        self._set_cookie(root)
+        logger.info(f"CIMC {self.ip} Login successfully.")
+        return self.cookie
+
+    def refresh(self):
+        root = self.post(
+            "<aaaRefresh cookie={0} inCookie={0} inName={1} inPassword={2}>"
+            "</aaaRefresh>".format(
+                quoteattr(self.cookie),
+                quoteattr(self.username),
+                quoteattr(self.password))
+        )
+        self._set_cookie(root)
+        return self.cookie
+
+    def logout(self):
+        if not self.cookie:
+            return
+        try:
+            self.post("<aaaLogout cookie={0} inCookie={0}></aaaLogout>"
+                      .format(quoteattr(self.cookie)))
+            logger.info(f"Logout CIMC {self.ip} successfully.")
+        except Exception as e:
+            logger.error(f"Logout CIMC {self.ip} failed: {e}")
+        self.cookie = None
+
+    def _ensure_cookie(self):
+        with self.lock:
+            if not self.cookie:
+                self.login()
+            elif self.refresh_period and \
+                    time.monotonic() - self.cookie_time > \
+                    self.refresh_period * settings.CIMC_COOKIE_REFRESH_RATIO:
+                self.refresh()
+
+    def _request(self, method, attributes, config):
+        request = "<{} cookie={}{}".format(
+            method, quoteattr(self.cookie), attributes)
+        if config is None:
+            return request + "/>"
+        return request + "><inConfig>{}</inConfig></{}>".format(
+            config, method)
+
+    def call(self, method, attributes="", config=None):
+        """Run an authenticated XML API method, e.g. configResolveClass."""
+        self._ensure_cookie()
+        try:
+            return self.post(self._request(method, attributes, config))
+        except CimcApiError as e:
+            if e.code not in AUTH_ERROR_CODES:
+                raise
+            # Cookie expired or was revoked by the CIMC,
+            # login again and retry once.
+            with self.lock:
+                self.login()
+            return self.post(self._request(method, attributes, config))
+
+    def resolve_class(self, class_id, hierarchical=False):
+        return self.call(
+            "configResolveClass",
+            " inHierarchical='{}' classId={}".format(
+                str(hierarchical).lower(), quoteattr(class_id))
         )
 
-        if response.status_code == 200:
-            return response
-        else:
-            msg = f"APIC CIMC {CIMC_IP} connected failed!"
-            logger.error(msg)
-            return False
-    except Exception as e:
-        msg = "{}".format(e)
-        logger.error(msg)
-        return False
-
-
-def cimc_login(CIMC_IP, CIMC_USERNAME, CIMC_PASSWORD):
-    try:
-        data = f"<aaaLogin inName='{CIMC_USERNAME}' " \
-               f"inPassword='{CIMC_PASSWORD}'></aaaLogin>"
-        response = cimc_api(CIMC_IP, data)
-        token = ET.fromstring(response.text).attrib['outCookie']
-        if token:
-            logger.info(f"CIMC Login token: {token}")
-            return token
-        else:
-            msg = f"CIMC {CIMC_IP} Login failed!"
-            logger.error(msg)
-            return False
+    def resolve_dn(self, dn, hierarchical=False):
+        return self.call(
+            "configResolveDn",
+            " inHierarchical='{}' dn={}".format(
+                str(hierarchical).lower(), quoteattr(dn))
+        )
 
-    except Exception as e:
-        msg = "{}".format(e)
-        logger.error(msg)
-        return False
+    def _iter_response(self, request, tag, raw):
+        response = self.session.post(
+            url=self.url,
+            data=request,
+            timeout=self.timeout,
+            stream=True
+        )
+        try:
+            if response.status_code != 200:
+                raise CimcApiError(f"APIC CIMC {self.ip} connected failed!")
+            response.raw.decode_content = True
+            source = response.raw if raw is None \
+                else _TeeReader(response.raw, raw)
+            stack = []
+            for event, elem in ET.iterparse(source, events=("start", "end")):
+                if event == "start":
+                    if not stack and elem.get('errorCode'):
+                        raise CimcApiError(
+                            "APIC CIMC {} {} failed: {}".format(
+                                self.ip, elem.tag, elem.get('errorDescr')),
+                            code=elem.get('errorCode')
+                        )
+                    stack.append(elem)
+                    continue
+                stack.pop()
+                if elem.tag == tag:
+                    yield elem
+                    # Drop the processed element, so memory stays flat
+                    # however long the response is.
+                    elem.clear()
+                    if stack:
+                        stack[-1].remove(elem)
+        finally:
+            response.close()
+
+    def iter_response(self, method, attributes, tag, raw=None):
+        """
+        Run an authenticated XML API method and yield every tag element
+        as soon as it is parsed from the streamed response.
+
+        raw is an optional binary file receiving the raw payload.
+        """
+        self._ensure_cookie()
+        started = False
+        try:
+            for elem in self._iter_response(
+                    self._request(method, attributes, None), tag, raw):
+                started = True
+                yield elem
+        except CimcApiError as e:
+            if started or e.code not in AUTH_ERROR_CODES:
+                raise
+            with self.lock:
+                self.login()
+            yield from self._iter_response(
+                self._request(method, attributes, None), tag, raw)
+
+    def iter_class(self, class_id, raw=None):
+        return self.iter_response(
+            "configResolveClass",
+            " inHierarchical='false' classId={}".format(quoteattr(class_id)),
+            class_id,
+            raw
+        )
 
+    def iter_dn(self, dn, tag, raw=None):
+        return self.iter_response(
+            "configResolveDn",
+            " inHierarchical='false' dn={}".format(quoteattr(dn)),
+            tag,
+            raw
+        )
 
-def cimc_logout(CIMC_IP, token):
+    def first_attribute(self, elements, attribute):
+        """Return attribute of the first streamed element."""
+        try:
+            for elem in elements:
+                return elem.get(attribute)
+        finally:
+            elements.close()
+        raise CimcApiError(f"APIC CIMC {self.ip} no {attribute} returned!")
+
+    def run_concurrently(self, jobs):
+        """
+        Run several API calls concurrently over the same session.
+
+        jobs is a dict of name to callable; returns a dict of name to
+        result. The CIMC XML API has no multi-class resolve method, so
+        requests are pipelined over the pooled keep-alive connections
+        instead of batched.
+        """
+        self._ensure_cookie()
+        with ThreadPoolExecutor(max_workers=len(jobs) or 1) as executor:
+            futures = {
+                name: executor.submit(job) for name, job in jobs.items()
+            }
+            return {name: future.result() for name, future in futures.items()}
+
+    def resolve_many(self, queries):
+        """
+        Run several class/dn queries concurrently, see run_concurrently.
+
+        queries is a dict of name to ("class", class_id) or ("dn", dn);
+        returns a dict of name to parsed response root.
+        """
+
+        def _resolve(kind, value):
+            if kind == "dn":
+                return lambda: self.resolve_dn(value)
+            return lambda: self.resolve_class(value)
+
+        return self.run_concurrently({
+            name: _resolve(*query) for name, query in queries.items()
+        })
+
+    def conf_mo(self, config):
+        return self.call("configConfMo", config=config)
+
+
+class _TeeReader:
+    """File-like wrapper copying everything read into another file."""
+
+    def __init__(self, source, sink):
+        self.source = source
+        self.sink = sink
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        self.sink.write(data)
+        return data
+
+
+def cimc_fault_summary(client, report=None):
+    """
+    Stream the CIMC faultInst inventory, aggregating faults by severity
+    and code instead of keeping or logging the whole response.
+
+    The raw response is saved gzip-compressed in the log directory when
+    CIMC_FAULT_ARTIFACT is enabled. Returns False if any fault has one of
+    the CIMC_FAULT_FAIL_SEVERITIES.
+    """
+    by_severity = Counter()
+    by_code = {}
+    artifact = None
+    if settings.CIMC_FAULT_ARTIFACT:
+        artifact_path = os.path.join(
+            settings.OUTPUT_BASE_DIR,
+            'iac_init_log',
+            f'cimc_faults_{client.ip}.xml.gz'
+        )
+        artifact = gzip.open(artifact_path, 'wb')
     try:
-        data = f"<aaaLogout cookie='{token}'inCookie='{token}'> </aaaLogout>"
-        cimc_api(CIMC_IP, data)
-        logger.info(f"Logout CIMC {CIMC_IP} with token {token} successfully.")
-
-    except Exception as e:
-        msg = "{}".format(e)
-        logger.error(msg)
+        for fault in client.iter_class('faultInst', raw=artifact):
+            severity = fault.get('severity', 'unknown')
+            code = fault.get('code', 'unknown')
+            by_severity[severity] += 1
+            if code not in by_code:
+                by_code[code] = [severity, fault.get('descr', ''), 0]
+            by_code[code][2] += 1
+    finally:
+        if artifact is not None:
+            artifact.close()
+            logger.info(f"Saved CIMC {client.ip} fault info to "
+                        f"{artifact_path}")
+
+    total = sum(by_severity.values())
+    logger.info("CIMC {} fault summary: {} fault(s) {}".format(
+        client.ip,
+        total,
+        ", ".join(f"{severity}={count}"
+                  for severity, count in by_severity.most_common())
+    ))
+    for code, (severity, descr, count) in sorted(
+            by_code.items(), key=lambda item: -item[1][2]):
+        logger.info(f"  {code} [{severity}] x{count}: {descr}")
+
+    if report is not None:
+        report["faults"] = total
+        report["fault_severity"] = dict(by_severity)
+
+    fail_severity = [
+        severity for severity in settings.CIMC_FAULT_FAIL_SEVERITIES
+        if by_severity.get(severity)
+    ]
+    if fail_severity:
+        logger.error("CIMC {}: {} fault(s) found!".format(
+            client.ip, ",".join(fail_severity)))
         return False
+    return True
 
 
-def cimc_health_check(CIMC_IP, token):
+def cimc_health_check(client, report=None):
     try:
-        firmware_data = f'''
-        <!-- firmware version -->
-        <configResolveDn cookie="{token}" inHierarchical='false'
-        dn="sys/rack-unit-1/mgmt/fw-system"/>
-        '''
-        firmware_response = cimc_api(CIMC_IP, firmware_data)
-        # logger.info(firmware_response.text)
-        firmware_version = ET.fromstring(
-            firmware_response.text).find(
-            './/firmwareRunning').attrib['version']
+        response = client.run_concurrently({
+            "firmware": lambda: client.first_attribute(
+                client.iter_dn(
+                    "sys/rack-unit-1/mgmt/fw-system", "firmwareRunning"),
+                "version"
+            ),
+            "fault": lambda: cimc_fault_summary(client, report),
+            "tpm": lambda: client.first_attribute(
+                client.iter_class("equipmentTpm"),
+                "enabledStatus"
+            ),
+        })
+
+        firmware_version = response["firmware"]
         logger.info(f"Current Firmware version is: {firmware_version}")
+        if report is not None:
+            report["firmware"] = firmware_version
 
-        fault_data = f'''
-        <!-- fault info -->
-        <configResolveClass cookie="{token}"
-        inHierarchical='false' classId='faultInst'/>
-        '''
-        logger.info("Logging CIMC fault info:")
-        fault_response = cimc_api(CIMC_IP, fault_data)
-        logger.info(fault_response.text)
-
-        tpm_data = f'''
-        <!-- TPM status -->
-        <configResolveClass cookie="{token}"
-        inHierarchical='false' classId='equipmentTpm'/>
-        '''
-        tpm_response = cimc_api(CIMC_IP, tpm_data)
-        # logger.info(tpm_response.text)
-        tpm_status = ET.fromstring(tpm_response.text).find(
-            './/equipmentTpm').attrib['enabledStatus']
+        tpm_status = response["tpm"]
         logger.info(f"Current TPM status is: {tpm_status}")
+        if report is not None:
+            report["tpm"] = tpm_status
+
+        if not response["fault"]:
+            return False
 
         if "enable" not in tpm_status:
-            logger.error(f"CIMC {CIMC_IP}: TPM is not enabled!")
+            logger.error(f"CIMC {client.ip}: TPM is not enabled!")
             return False
 
         return True
@@ -119,68 +391,45 @@ def cimc_health_check(CIMC_IP, token):
         return False
 
 
-def cimc_mapping_clean(CIMC_IP, token):
+def cimc_mapping_clean(client, report=None):
     try:
-        cimc_mapping_data = f'''
-        <!-- Retrieve CIMC mapping -->
-        <configResolveClass cookie="{token}"
-        inHierarchical='false' classId='commVMediaMap'/>
-        '''
-        cimc_mapping_response = cimc_api(CIMC_IP, cimc_mapping_data)
-        # logger.info(cimc_mapping_response.text)
-        if re.search(r'commVMediaMap volumeName', cimc_mapping_response.text):
-            existing_mapping = ET.fromstring(
-                cimc_mapping_response.text).find(
-                './/commVMediaMap').attrib['volumeName']
+        response = client.resolve_many({
+            "mapping": ("class", "commVMediaMap"),
+            "boot": ("class", "lsbootVMedia"),
+        })
+
+        mapping = response["mapping"].find('.//commVMediaMap')
+        if mapping is not None and mapping.get('volumeName'):
+            existing_mapping = mapping.get('volumeName')
             logger.info(f"Removing existing mapping: {existing_mapping}")
-            cimc_mapping_clear_data = f'''
-            <!-- CIMC mapping clear -->
-            <configConfMo cookie="{token}"><inConfig>
+            client.conf_mo(
+                f'''
                 <commVMediaMap
                 dn="sys/svc-ext/vmedia-svc/vmmap-{existing_mapping}"
                 volumeName="{existing_mapping}"
                 status='removed' ></commVMediaMap>
-            </inConfig></configConfMo>
-            '''
-            cimc_mapping_clear_response = cimc_api(
-                CIMC_IP,
-                cimc_mapping_clear_data
+                '''
             )
-            if cimc_mapping_clear_response:
-                logger.info(f"Removed existing mapping: {existing_mapping}")
-            else:
-                return False
-
-        cimc_boot_data = f'''
-        <!-- Retrieve CIMC boot order -->
-        <configResolveClass cookie="{token}"
-        inHierarchical='false' classId='lsbootVMedia'/>
-        '''
-        cimc_boot_data_response = cimc_api(CIMC_IP, cimc_boot_data)
-        # logger.info(cimc_boot_data_response.text)
-        if re.search(r'lsbootVMedia name', cimc_boot_data_response.text):
-            existing_bootorder = ET.fromstring(
-                cimc_boot_data_response.text).find(
-                './/lsbootVMedia').attrib['name']
+            logger.info(f"Removed existing mapping: {existing_mapping}")
+            if report is not None:
+                report["cleaned"].append(f"vmedia:{existing_mapping}")
+
+        bootorder = response["boot"].find('.//lsbootVMedia')
+        if bootorder is not None and bootorder.get('name'):
+            existing_bootorder = bootorder.get('name')
             logger.info(f"Removing existing boot order: {existing_bootorder}")
-            cimc_bootorder_clear_data = f'''
-            <!-- CIMC boot order clear -->
-            <configConfMo cookie="{token}"><inConfig>
+            client.conf_mo(
+                f'''
                 <lsbootVMedia
                 dn="sys/rack-unit-1/boot-precision/vm-{existing_bootorder}"
                 name="{existing_bootorder}" status='removed' ></lsbootVMedia>
-            </inConfig></configConfMo>
-            '''
-            cimc_bootorder_clear_response = cimc_api(
-                CIMC_IP,
-                cimc_bootorder_clear_data
+                '''
+            )
+            logger.info(
+                f"Removed existing boot order: {existing_bootorder}"
             )
-            if cimc_bootorder_clear_response:
-                logger.info(
-                    f"Removed existing boot order: {existing_bootorder}"
-                )
-            else:
-                return False
+            if report is not None:
+                report["cleaned"].append(f"boot:{existing_bootorder}")
 
         return True
 
@@ -190,20 +439,12 @@ def cimc_mapping_clean(CIMC_IP, token):
         return False
 
 
-def power_down_cimc(CIMC_IP, token):
+def power_down_cimc(client):
     try:
-        cimc_power_down_data = f'''
-        <!-- CIMC Power Off -->
-        <configConfMo cookie="{token}"><inConfig>
-            <computeRackUnit dn="sys/rack-unit-1" adminPower="down" />
-        </inConfig></configConfMo>
-        '''
-        cimc_power_down_response = cimc_api(CIMC_IP, cimc_power_down_data)
-        if cimc_power_down_response:
-            logger.info("CIMC is powered down.")
-        else:
-            return False
-
+        client.conf_mo(
+            '<computeRackUnit dn="sys/rack-unit-1" adminPower="down" />'
+        )
+        logger.info(f"CIMC {client.ip} is powered down.")
         return True
 
     except Exception as e:
@@ -212,31 +453,62 @@ def power_down_cimc(CIMC_IP, token):
         return False
 
 
-def cimc_precheck(CIMC_IP, CIMC_USERNAME, CIMC_PASSWORD):
+def new_precheck_report():
+    return {
+        "firmware": None,
+        "tpm": None,
+        "faults": None,
+        "fault_severity": {},
+        "cleaned": [],
+        "timings": {},
+    }
+
+
+def cimc_precheck(CIMC_IP, CIMC_USERNAME, CIMC_PASSWORD, report=None):
+    """
+    Run CIMC pre-check, filling report (see new_precheck_report) with
+    firmware version, TPM state, fault count, cleaned mappings and the
+    time spent in each stage.
+    """
+    if report is None:
+        report = new_precheck_report()
+
+    def _timed(stage, func, *args):
+        start_time = time.monotonic()
+        try:
+            return func(*args)
+        finally:
+            report["timings"][stage] = time.monotonic() - start_time
+
+    client = CimcClient(CIMC_IP, CIMC_USERNAME, CIMC_PASSWORD)
     try:
-        token = cimc_login(CIMC_IP, CIMC_USERNAME, CIMC_PASSWORD)
-        health_check_result = cimc_health_check(CIMC_IP, token)
+        _timed("login", client.login)
+        logger.info(f"CIMC {CIMC_IP} Login token: {client.cookie}")
+        health_check_result = _timed(
+            "health_check", cimc_health_check, client, report)
         if not health_check_result:
-            logger.error("CIMC health check failed!")
+            logger.error(f"CIMC {CIMC_IP} health check failed!")
             return False
 
-        logger.info("CIMC health check pass!")
+        logger.info(f"CIMC {CIMC_IP} health check pass!")
 
-        cimc_mapping_clean_result = cimc_mapping_clean(
-            CIMC_IP,
-            token
-        )
+        cimc_mapping_clean_result = _timed(
+            "mapping_clean", cimc_mapping_clean, client, report)
         if not cimc_mapping_clean_result:
-            logger.error("CIMC mapping clean failed!")
+            logger.error(f"CIMC {CIMC_IP} mapping clean failed!")
             return False
 
-        logger.info("CIMC mapping clean successfully.")
-        logger.info("Powering down CIMC...")
-        power_down_cimc(CIMC_IP, token)
-        cimc_logout(CIMC_IP, token)
+        logger.info(f"CIMC {CIMC_IP} mapping clean successfully.")
+        logger.info(f"Powering down CIMC {CIMC_IP}...")
+        # A failed power down is logged but does not fail the pre-check
+        _timed("power_down", power_down_cimc, client)
         return True
 
     except Exception as e:
         msg = "{}".format(e)
         logger.error(msg)
         return False
+
+    finally:
+        _timed("logout", client.logout)
+        client.session.close()
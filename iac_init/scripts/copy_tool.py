@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Wang Xiao <xiawang3@cisco.com>
+
+import os
+import errno
+import shutil
+from typing import Iterable, Optional, Set, Tuple
+
+from iac_init.conf import settings
+from iac_init.scripts.logging_tool import setup_logging
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # type: ignore
+
+logger = setup_logging()
+
+# ioctl request cloning a whole file, from linux/fs.h
+FICLONE = 0x40049409
+
+# (method, st_dev) pairs the filesystem turned down, not tried again
+_unsupported: Set[Tuple[str, int]] = set()
+
+# Errors of a method the filesystem does not support, as opposed to
+# errors of the file at hand
+_UNSUPPORTED_ERRNOS = {
+    errno.EOPNOTSUPP, errno.ENOTSUP, errno.EXDEV, errno.EINVAL,
+    errno.ENOTTY, errno.ENOSYS,
+}
+
+
+def _reflink(source: str, destination: str) -> None:
+    if fcntl is None:
+        raise OSError(errno.ENOTSUP,
+                      "Reflinks are not supported on this platform")
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    shutil.copymode(source, destination)
+
+
+def _place(method: str, source: str, destination: str) -> None:
+    if method == "reflink":
+        _reflink(source, destination)
+    elif method == "hardlink":
+        os.link(source, destination)
+    elif method == "copy":
+        shutil.copy(source, destination)
+    else:
+        raise ValueError("Unknown copy method: {}".format(method))
+
+
+def copy_file(
+        source: str,
+        destination: str,
+        methods: Optional[Iterable[str]] = None
+) -> str:
+    """
+    Place the content of file source at file path destination.
+
+    Methods, STATIC_FILE_METHODS by default, are tried in order: "reflink"
+    and "hardlink" only within a filesystem, with "copy" as last resort.
+    destination is replaced, never written through, so an earlier
+    hardlink to another file is left alone. Only hardlink files nobody
+    edits, such as installed templates. Returns the method used.
+    """
+    if methods is None:
+        methods = settings.STATIC_FILE_METHODS
+    directory = os.path.dirname(destination) or "."
+    device = os.stat(directory).st_dev
+    same_filesystem = os.stat(source).st_dev == device
+    temporary = os.path.join(directory, ".{}.{}.tmp".format(
+        os.path.basename(destination), os.getpid()))
+
+    for method in methods:
+        if method == "copy":
+            break
+        if not same_filesystem or (method, device) in _unsupported:
+            continue
+        try:
+            _place(method, source, temporary)
+            os.replace(temporary, destination)
+            return method
+        except OSError as e:
+            if os.path.lexists(temporary):
+                os.remove(temporary)
+            logger.info("Cannot {} {} to {}, falling back: {}".format(
+                method, source, destination, e))
+            if e.errno in _UNSUPPORTED_ERRNOS:
+                _unsupported.add((method, device))
+
+    try:
+        _place("copy", source, temporary)
+        os.replace(temporary, destination)
+    finally:
+        if os.path.lexists(temporary):
+            os.remove(temporary)
+    return "copy"
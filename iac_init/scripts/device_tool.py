@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Wang Xiao <xiawang3@cisco.com>
+
+import os
+import json
+import time
+import subprocess
+from typing import Any, Callable, Dict, IO, List, Optional, Tuple
+from xml.sax.saxutils import quoteattr
+
+from iac_init.conf import settings
+from iac_init.scripts.cimc_precheck_tool import CimcClient
+from iac_init.scripts.thread_tool import run_in_pool
+from iac_init.scripts.logging_tool import setup_logging, format_table
+
+logger = setup_logging()
+
+# Exit code recorded when a stage runs past its deadline, as timeout(1)
+TIMEOUT_EXIT_CODE = 124
+
+# A stage writes its output to the device log and returns its exit code.
+# It is given the seconds left before the device deadline, if any.
+Stage = Callable[[IO[bytes], Optional[float]], int]
+
+
+def expect_stage(script: str, timeout: Optional[float] = None) -> Stage:
+    """
+    Stage running the expect script, killed after timeout seconds or at
+    the device deadline, whichever comes first.
+    """
+
+    def run(log: IO[bytes], remaining: Optional[float]) -> int:
+        deadline = min(
+            (t for t in (timeout, remaining) if t is not None), default=None)
+        try:
+            return subprocess.run(
+                [settings.EXPECT_PATH, script],
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                timeout=deadline
+            ).returncode
+        except subprocess.TimeoutExpired:
+            log.write("Timed out after {:.0f} seconds\n"
+                      .format(deadline).encode())
+            return TIMEOUT_EXIT_CODE
+
+    return run
+
+
+def cimc_stage(
+        cimc_ip: str,
+        cimc_username: str,
+        cimc_password: str,
+        configs: List[str]
+) -> Stage:
+    """
+    Stage applying the configConfMo configs to the CIMC, in order. Each
+    request times out after CIMC_CONFIG_TIMEOUT seconds or at the device
+    deadline, whichever comes first.
+    """
+
+    def run(log: IO[bytes], remaining: Optional[float]) -> int:
+        timeout = settings.CIMC_CONFIG_TIMEOUT
+        if remaining is not None:
+            timeout = min(timeout, remaining)
+        try:
+            with CimcClient(cimc_ip, cimc_username, cimc_password,
+                            timeout) as client:
+                for config in configs:
+                    client.conf_mo(config)
+                    log.write("Configured {}\n".format(config).encode())
+        except Exception as e:
+            log.write("CIMC {} configuration failed: {}\n"
+                      .format(cimc_ip, repr(e)).encode())
+            return 1
+        return 0
+
+    return run
+
+
+def _run_pipeline(
+        stages: List[Tuple[str, Stage]],
+        log_path: str,
+        timeout: Optional[float] = None
+) -> List[Tuple[str, int]]:
+    """
+    Run stages in order until one fails or the device deadline, timeout
+    seconds from now, passes. Returns the exit codes of the stages run.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    codes = []
+    with open(log_path, "ab", buffering=0) as log:
+        for name, stage in stages:
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    log.write("=== {} not started, deadline passed\n"
+                              .format(name).encode())
+                    codes.append((name, TIMEOUT_EXIT_CODE))
+                    break
+            log.write("=== {} started {}\n".format(
+                name, time.strftime("%Y-%m-%d %H:%M:%S")).encode())
+            start_time = time.monotonic()
+            code = stage(log, remaining)
+            log.write("=== {} exit code {} ({:.0f}s)\n".format(
+                name, code, time.monotonic() - start_time).encode())
+            codes.append((name, code))
+            if code != 0:
+                break
+    return codes
+
+
+def run_device_pipelines(
+        pipelines: Dict[str, List[Tuple[str, Stage]]],
+        max_workers: int,
+        log_prefix: str,
+        timeout: Optional[float] = None
+) -> bool:
+    """
+    Run the stages of every device pipeline, devices in parallel.
+
+    At most max_workers devices run at a time, the stages of a device run
+    in order and stop at the first non-zero exit code, or once timeout
+    seconds have passed since the device started. Output of device
+    goes to <log_prefix>_<device>.log and the exit codes of all devices
+    to <log_prefix>.json. Returns whether every stage of every device
+    exited with 0.
+    """
+    os.makedirs(os.path.dirname(log_prefix), exist_ok=True)
+    devices = list(pipelines)
+    log_paths = {
+        device: "{}_{}.log".format(log_prefix, device) for device in devices
+    }
+    results = run_in_pool(
+        lambda device: _run_pipeline(
+            pipelines[device], log_paths[device], timeout),
+        [(device,) for device in devices],
+        max_workers
+    )
+
+    rows = []
+    summary: Dict[str, Dict[str, Any]] = {}
+    success = True
+    for device, result in zip(devices, results):
+        codes = result["result"] if result["error"] is None else []
+        passed = result["error"] is None \
+            and len(codes) == len(pipelines[device]) \
+            and all(code == 0 for _, code in codes)
+        success = success and passed
+        summary[device] = {
+            "success": passed,
+            "exit_codes": dict(codes),
+            "elapsed": round(result["elapsed"], 1),
+            "error": result["error"],
+            "log": log_paths[device],
+        }
+        rows.append([
+            device,
+            "OK" if passed else "FAILED",
+            ", ".join("{}={}".format(name, code) for name, code in codes),
+            "{:.0f}s".format(result["elapsed"]),
+            result["error"] or "",
+            log_paths[device],
+        ])
+
+    with open("{}.json".format(log_prefix), "w") as file:
+        json.dump(summary, file, indent=2)
+    logger.info("Device results:\n{}".format(format_table(
+        ["Device", "State", "Exit codes", "Time", "Error", "Log"], rows)))
+    return success
+
+
+def reimage_switches(
+        switches: List[Dict[str, Any]],
+        working_dir: str,
+        log_prefix: str
+) -> bool:
+    """
+    Reimage switches in parallel with their rendered expect scripts in
+    working_dir, each followed by its post check.
+    """
+    pipelines = {}
+    try:
+        for switch in switches:
+            hostname = switch["hostname"]
+            pipelines[hostname] = [
+                ("reimage", expect_stage(
+                    os.path.join(working_dir,
+                                 "aci_switch_reimage_{}.exp"
+                                 .format(hostname)),
+                    settings.SWITCH_REIMAGE_TIMEOUT)),
+                ("post_check", expect_stage(
+                    os.path.join(working_dir,
+                                 "aci_switch_reimage_post_check_{}.exp"
+                                 .format(hostname)),
+                    settings.SWITCH_REIMAGE_TIMEOUT)),
+            ]
+    except KeyError as e:
+        logger.error("Switch data missing: {}".format(e))
+        return False
+    logger.info("Reimaging {} switches, {} at a time.".format(
+        len(pipelines), min(len(pipelines),
+                            settings.SWITCH_REIMAGE_MAX_WORKERS)))
+    return run_device_pipelines(
+        pipelines, settings.SWITCH_REIMAGE_MAX_WORKERS, log_prefix)
+
+
+def _attr(value: Any) -> str:
+    return quoteattr("" if value is None else str(value))
+
+
+def apic_reimage_cimc_configs(
+        apic: Dict[str, Any], global_policies: Dict[str, Any]
+) -> List[str]:
+    """CIMC configs booting an APIC from the APIC ISO mapped over HTTP."""
+    return [
+        '<mgmtIf dn="sys/rack-unit-1/mgmt/if-1" hostname={}/>'
+        .format(_attr(apic["hostname"])),
+        '<computeRackUnit dn="sys/rack-unit-1" usrLbl={}/>'
+        .format(_attr(apic["description"])),
+        '<topSystem dn="sys" timeZone={}/>'
+        .format(_attr(global_policies["timezone"])),
+        '<commNtpProvider dn="sys/svc-ext/ntp-svc" ntpServer1={}/>'
+        .format(_attr(global_policies["ntp_server"])),
+        '<solIf dn="sys/rack-unit-1/sol-if" adminState="enable" '
+        'speed="115200" comport="com0" sshPort="2400"/>',
+        '<commVMediaMap volumeName="aci-automation" map="www" '
+        'remoteShare={} remoteFile={} '
+        'dn="sys/svc-ext/vmedia-svc/vmmap-aci-automation"></commVMediaMap>'
+        .format(_attr(global_policies["aci_image_path"]),
+                _attr(global_policies["apic_image"])),
+        '<lsbootVMedia dn="sys/rack-unit-1/boot-precision/vm-cimc-map" '
+        'name="cimc-map" type="VMEDIA" subtype="cimc-mapped-dvd" '
+        'order="1" state="Enabled"/>',
+        '<computeRackUnit dn="sys/rack-unit-1" adminPower="up"/>',
+    ]
+
+
+# CIMC configs removing the ISO mapping and booting the APIC from disk
+APIC_POST_INSTALL_CIMC_CONFIGS = [
+    '<lsbootVMedia dn="sys/rack-unit-1/boot-precision/vm-cimc-map" '
+    'name="cimc-map" status="removed"/>',
+    '<commVMediaMap dn="sys/svc-ext/vmedia-svc/vmmap-aci-automation" '
+    'volumeName="aci-automation" status="removed"></commVMediaMap>',
+    '<lsbootStorage dn="sys/rack-unit-1/boot-policy/storage-read-write" '
+    'access="read-write" order="1" type="storage"/>',
+    '<computeRackUnit dn="sys/rack-unit-1" adminPower="up"/>',
+]
+
+
+def reimage_apics(
+        fabric: Dict[str, Any],
+        working_dir: str,
+        log_prefix: str
+) -> bool:
+    """
+    Reimage every APIC of fabric through its own pipeline: CIMC
+    configuration, ISO install with the rendered expect script in
+    working_dir, CIMC post installation and post check.
+    """
+    pipelines = {}
+    try:
+        global_policies = fabric["global_policies"]
+        username = global_policies["apic_cimc_username"]
+        password = global_policies["apic_cimc_password"]
+        for apic in fabric["apic_nodes_connection"]:
+            hostname = apic["hostname"]
+            pipelines[hostname] = [
+                ("cimc_config", cimc_stage(
+                    apic["cimc_address"], username, password,
+                    apic_reimage_cimc_configs(apic, global_policies))),
+                ("install", expect_stage(os.path.join(
+                    working_dir, "apic_reimage_{}.exp".format(hostname)))),
+                ("cimc_post_install", cimc_stage(
+                    apic["cimc_address"], username, password,
+                    APIC_POST_INSTALL_CIMC_CONFIGS)),
+                ("post_check", expect_stage(os.path.join(
+                    working_dir,
+                    "apic_reimage_post_check_{}.exp".format(hostname)))),
+            ]
+    except KeyError as e:
+        logger.error("APIC data missing: {}".format(e))
+        return False
+    logger.info("Reimaging {} APICs, {} at a time.".format(
+        len(pipelines), min(len(pipelines),
+                            settings.APIC_REIMAGE_MAX_WORKERS)))
+    return run_device_pipelines(
+        pipelines, settings.APIC_REIMAGE_MAX_WORKERS, log_prefix,
+        settings.APIC_REIMAGE_TIMEOUT)
@@ -5,11 +5,19 @@
 import paramiko
 
 
-def check_ssh_connection(ip: str, username: str, password: str):
+def check_ssh_connection(
+        ip: str, username: str, password: str, timeout: int = 300):
     try:
         client = paramiko.SSHClient()
         client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        client.connect(ip, username=username, password=password, timeout=300)
+        client.connect(
+            ip,
+            username=username,
+            password=password,
+            timeout=timeout,
+            banner_timeout=timeout,
+            auth_timeout=timeout
+        )
         client.close()
         return True
     except Exception:
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Wang Xiao <xiawang3@cisco.com>
+
+import time
+import asyncio
+
+
+async def _check_port(ip, port, timeout, attempts):
+    error = None
+    for _ in range(max(1, attempts)):
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(ip, port), timeout=timeout)
+            writer.close()
+            return True, None
+        except asyncio.TimeoutError:
+            error = "timeout"
+        except OSError as e:
+            error = e.strerror or str(e)
+    return False, error
+
+
+def scan_ports(targets, timeout, attempts=1, limit=256):
+    """
+    TCP connect scan of (ip, port) targets, all in parallel from one
+    event loop, at most limit connections at a time.
+
+    Returns one dict per target, in input order, in the run_in_pool
+    result format (result, elapsed, error).
+    """
+
+    async def _scan(semaphore, ip, port):
+        async with semaphore:
+            start_time = time.monotonic()
+            result, error = await _check_port(ip, port, timeout, attempts)
+            return {
+                "result": result,
+                "elapsed": time.monotonic() - start_time,
+                "error": error,
+            }
+
+    async def _scan_all():
+        semaphore = asyncio.Semaphore(max(1, limit))
+        return await asyncio.gather(*[
+            _scan(semaphore, ip, int(port)) for ip, port in targets
+        ])
+
+    if not targets:
+        return []
+    return asyncio.run(_scan_all())
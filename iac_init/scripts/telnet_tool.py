@@ -2,61 +2,199 @@
 
 # Copyright: (c) 2024, Wang Xiao <xiawang3@cisco.com>
 
+import re
 import time
-import telnetlib
+import asyncio
 
 from iac_init.scripts.logging_tool import setup_logging
 
 logger = setup_logging()
 
+IAC, DONT, DO, WONT, WILL, SB, SE = 255, 254, 253, 252, 251, 250, 240
 
-class TelnetClient:
-    def __init__(
-            self,
-            telnet_ip,
-            telnet_port,
-            telnet_username,
-            telnet_password
-    ):
-        self.tn = telnetlib.Telnet()
+LOGIN_PROMPT = re.compile(rb'login: ')
+PASSWORD_PROMPT = re.compile(rb'[Pp]assword: ')
+LOGIN_INCORRECT = re.compile(rb'Login incorrect')
+# Last line of the output ending in a prompt character, so a banner line
+# made of "#" or ">" only does not count as a shell prompt
+SHELL_PROMPT = re.compile(rb'(?m)^[^\r\n]*[^\s#>$][#>$] ?\Z')
+# ANSI escape sequences, e.g. colors and erase line after the prompt
+ANSI_ESCAPE = re.compile(rb'\x1b\[[0-?]*[ -/]*[@-~]|\x1b[ -/]*[0-Z\\-~]')
+
+
+class AsyncTelnetClient:
+    """
+    Minimal asyncio Telnet client with expect-style prompt matching,
+    so many consoles can be driven from a single event loop.
+
+    All Telnet options offered by the server are refused.
+    """
+
+    def __init__(self, telnet_ip, telnet_port, timeout=10):
         self.host_ip = telnet_ip
         self.port = telnet_port
-        self.username = telnet_username
-        self.password = telnet_password
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+        self.buffer = b''
+        self._pending = b''
 
-    def login_host(self):
-        try:
-            self.tn.open(self.host_ip, self.port)
+    async def open(self):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host_ip, self.port),
+            timeout=self.timeout
+        )
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
 
+    def write(self, data):
+        self.writer.write(data.replace(bytes([IAC]), bytes([IAC, IAC])))
+
+    def _negotiate(self, data):
+        """Strip Telnet commands from data, refusing every option."""
+        data = self._pending + data
+        self._pending = b''
+        result = bytearray()
+        i = 0
+        while i < len(data):
+            byte = data[i]
+            if byte != IAC:
+                result.append(byte)
+                i += 1
+                continue
+            if i + 1 >= len(data):
+                self._pending = data[i:]
+                break
+            command = data[i + 1]
+            if command == IAC:
+                result.append(IAC)
+                i += 2
+            elif command in (DO, DONT, WILL, WONT):
+                if i + 2 >= len(data):
+                    self._pending = data[i:]
+                    break
+                if command == DO:
+                    self.writer.write(bytes([IAC, WONT, data[i + 2]]))
+                elif command == WILL:
+                    self.writer.write(bytes([IAC, DONT, data[i + 2]]))
+                i += 3
+            elif command == SB:
+                end = data.find(bytes([IAC, SE]), i)
+                if end < 0:
+                    self._pending = data[i:]
+                    break
+                i = end + 2
+            else:
+                i += 2
+        return bytes(result)
+
+    async def expect(self, patterns, timeout=None):
+        """
+        Read until one of the compiled regex patterns matches.
+
+        Returns (index, match, text) like telnetlib.Telnet.expect, index is
+        -1 on timeout or EOF.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+        while True:
+            for index, pattern in enumerate(patterns):
+                match = pattern.search(self.buffer)
+                if match:
+                    text = self.buffer[:match.end()]
+                    self.buffer = self.buffer[match.end():]
+                    return index, match, text
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                data = await asyncio.wait_for(
+                    self.reader.read(4096), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            if not data:
+                break
+            # Escape sequences cut between reads are removed once complete
+            self.buffer = ANSI_ESCAPE.sub(
+                b'', self.buffer + self._negotiate(data))
+        text, self.buffer = self.buffer, b''
+        return -1, None, text
+
+    async def login_host(self, telnet_username, telnet_password):
+        try:
+            await self.open()
         except Exception as e:
             logger.error(
                 '{}:{} connected failed!'
                 .format(self.host_ip, self.port)
             )
             logger.error(f"Exception details:\n {e}")
-            self.tn.close()
             return False
 
-        self.tn.read_until(b'login: ', timeout=10)
-        self.tn.write(self.username.encode('ascii') + b'\n')
-        self.tn.read_until(b'Password: ', timeout=10)
-        self.tn.write(self.password.encode('ascii') + b'\n')
-        time.sleep(2)
-        command_result = self.tn.read_very_eager()\
-            .decode('ascii')
-        # print(command_result)
-        if 'Login incorrect' not in command_result:
-            logger.info(
-                'Login {}:{} successfully.'
-                .format(self.host_ip, self.port)
-            )
-            self.tn.write(b"exit\n")
-            self.tn.close()
-            return True
-        else:
-            logger.error(
-                'Login {}:{} failed due to wrong username or password!'
-                .format(self.host_ip, self.port)
-            )
-            self.tn.close()
-            return False
+        try:
+            await self.expect([LOGIN_PROMPT])
+            self.write(telnet_username.encode('ascii') + b'\n')
+            await self.expect([PASSWORD_PROMPT])
+            self.write(telnet_password.encode('ascii') + b'\n')
+            index, _, _ = await self.expect(
+                [SHELL_PROMPT, LOGIN_INCORRECT, LOGIN_PROMPT])
+            if index == 0:
+                logger.info(
+                    'Login {}:{} successfully.'
+                    .format(self.host_ip, self.port)
+                )
+                self.write(b"exit\n")
+                await self.writer.drain()
+                return True
+            elif index < 0:
+                logger.error(
+                    'Login {}:{} failed due to no prompt in {} seconds!'
+                    .format(self.host_ip, self.port, self.timeout)
+                )
+                return False
+            else:
+                logger.error(
+                    'Login {}:{} failed due to wrong username or password!'
+                    .format(self.host_ip, self.port)
+                )
+                return False
+        finally:
+            self.close()
+
+
+def login_hosts(hosts, telnet_username, telnet_password, timeout, limit):
+    """
+    Log in to every (ip, port) console concurrently from one event loop,
+    at most limit sessions at a time.
+
+    Returns one dict per host, in input order, in the run_in_pool result
+    format (result, elapsed, error).
+    """
+
+    async def _login(semaphore, ip, port):
+        async with semaphore:
+            start_time = time.monotonic()
+            try:
+                client = AsyncTelnetClient(ip, port, timeout)
+                result, error = await client.login_host(
+                    telnet_username, telnet_password), None
+            except Exception as e:
+                result, error = False, str(e)
+            return {
+                "result": result,
+                "elapsed": time.monotonic() - start_time,
+                "error": error,
+            }
+
+    async def _login_all():
+        semaphore = asyncio.Semaphore(max(1, limit))
+        return await asyncio.gather(*[
+            _login(semaphore, ip, port) for ip, port in hosts
+        ])
+
+    if not hosts:
+        return []
+    return asyncio.run(_login_all())
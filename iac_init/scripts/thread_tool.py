@@ -2,7 +2,9 @@
 
 # Copyright: (c) 2024, Wang Xiao <xiawang3@cisco.com>
 
+import time
 import threading
+from concurrent.futures import ThreadPoolExecutor
 
 
 class MyThread(threading.Thread):
@@ -17,3 +19,32 @@ class MyThread(threading.Thread):
 
     def get_result(self):
         return self.result
+
+
+def run_in_pool(target, args_list, max_workers):
+    """
+    Run target once per args tuple in a bounded thread pool.
+
+    Returns one dict per args tuple, in input order, holding the target
+    result, the elapsed seconds and the error raised (if any). Deadlines
+    are the responsibility of target, the pool only caps parallelism.
+    """
+
+    def _timed(args):
+        start_time = time.monotonic()
+        try:
+            result, error = target(*args), None
+        except Exception as e:
+            result, error = False, str(e)
+        return {
+            "result": result,
+            "elapsed": time.monotonic() - start_time,
+            "error": error,
+        }
+
+    if not args_list:
+        return []
+
+    workers = max(1, min(max_workers, len(args_list)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_timed, args_list))
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Wang Xiao <xiawang3@cisco.com>
+
+import os
+import tempfile
+import subprocess
+import importlib.util
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from iac_init.scripts.logging_tool import setup_logging
+
+logger = setup_logging()
+
+# Plaintext by ciphertext, for the lifetime of the run
+_plaintexts: Dict[str, str] = {}
+
+_vault_lib: Any = None
+
+
+def get_vault_id() -> Optional[str]:
+    """--vault-id of the iac_validate vault password script, if installed."""
+    spec = importlib.util.find_spec("iac_validate.ansible_vault")
+    if not spec:
+        return None
+    if "ANSIBLE_VAULT_ID" in os.environ:
+        return os.environ["ANSIBLE_VAULT_ID"] + "@" + str(spec.origin)
+    return str(spec.origin)
+
+
+def _decrypt_in_process(
+        ciphertexts: List[str], vault_id: str
+) -> Optional[Dict[str, Union[str, Exception]]]:
+    """Decrypt with Ansible's VaultLib, None if Ansible is not importable."""
+    global _vault_lib
+    try:
+        from ansible.parsing.dataloader import DataLoader
+        from ansible.parsing.vault import VaultLib, get_file_vault_secret
+    except ImportError:
+        return None
+
+    if _vault_lib is None:
+        name, _, filename = vault_id.rpartition("@")
+        try:
+            # Same secret lookup as "ansible-vault --vault-id", the
+            # password script runs once per run
+            secret = get_file_vault_secret(
+                filename=filename, vault_id=name or None, loader=DataLoader()
+            )
+            secret.load()
+        except Exception as e:
+            return {ciphertext: e for ciphertext in ciphertexts}
+        _vault_lib = VaultLib([(name or "default", secret)])
+
+    results: Dict[str, Union[str, Exception]] = {}
+    for ciphertext in ciphertexts:
+        try:
+            results[ciphertext] = _vault_lib.decrypt(ciphertext).decode()
+        except Exception as e:
+            results[ciphertext] = e
+    return results
+
+
+def _decrypt_subprocess(
+        ciphertext: str, vault_id: str
+) -> Union[str, Exception]:
+    try:
+        return subprocess.check_output(
+            ["ansible-vault", "decrypt", "--vault-id", vault_id],
+            input=ciphertext.encode(),
+        ).decode()
+    except Exception as e:
+        return e
+
+
+def _decrypt_batch(
+        ciphertexts: List[str], vault_id: str
+) -> Dict[str, Union[str, Exception]]:
+    """Decrypt with a single ansible-vault call on one file per ciphertext.
+
+    If the call fails, each ciphertext is decrypted on its own so only the
+    broken ones fail.
+    """
+    if len(ciphertexts) == 1:
+        return {ciphertexts[0]: _decrypt_subprocess(ciphertexts[0], vault_id)}
+    # TemporaryDirectory is only accessible by the current user
+    with tempfile.TemporaryDirectory() as tmp:
+        files = []
+        for ciphertext in ciphertexts:
+            path = os.path.join(tmp, str(len(files)))
+            with open(path, "w") as file:
+                file.write(ciphertext)
+            files.append(path)
+        try:
+            subprocess.check_output(
+                ["ansible-vault", "decrypt", "--vault-id", vault_id] + files
+            )
+        except Exception as e:
+            logger.warning(
+                "Batch vault decryption failed, decrypting one by one: {}"
+                .format(e)
+            )
+            return {
+                ciphertext: _decrypt_subprocess(ciphertext, vault_id)
+                for ciphertext in ciphertexts
+            }
+        results: Dict[str, Union[str, Exception]] = {}
+        for ciphertext, path in zip(ciphertexts, files):
+            with open(path, "rb") as file:
+                results[ciphertext] = file.read().decode()
+        return results
+
+
+def decrypt_vault(
+        ciphertexts: Iterable[str]
+) -> Dict[str, Union[str, Exception]]:
+    """
+    Decrypt Ansible Vault ciphertexts, each one at most once per run.
+
+    Decryption runs in-process when Ansible is importable, otherwise in
+    a single ansible-vault call. Returns the plaintext, or the exception
+    it failed with, by ciphertext. Without the iac_validate vault password
+    script every plaintext is empty.
+    """
+    results: Dict[str, Union[str, Exception]] = {}
+    pending = []
+    for ciphertext in ciphertexts:
+        if ciphertext in _plaintexts:
+            results[ciphertext] = _plaintexts[ciphertext]
+        elif ciphertext not in results:
+            results[ciphertext] = ""
+            pending.append(ciphertext)
+    if not pending:
+        return results
+
+    vault_id = get_vault_id()
+    if vault_id is None:
+        return results
+    decrypted = _decrypt_in_process(pending, vault_id)
+    if decrypted is None:
+        decrypted = _decrypt_batch(pending, vault_id)
+    for ciphertext, plaintext in decrypted.items():
+        if not isinstance(plaintext, Exception):
+            _plaintexts[ciphertext] = plaintext
+        results[ciphertext] = plaintext
+    return results
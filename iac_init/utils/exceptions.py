@@ -2,3 +2,19 @@ class ImproperlyConfigured(Exception):
     """IAC-INIT is somehow improperly configured"""
 
     pass
+
+
+class CimcApiError(Exception):
+    """CIMC XML API request failed or returned an error response"""
+
+    def __init__(self, msg, code=None):
+        super().__init__(msg)
+        self.code = code
+
+
+class ApicApiError(Exception):
+    """APIC REST API request failed or returned an error response"""
+
+    def __init__(self, msg, status=None):
+        super().__init__(msg)
+        self.status = status
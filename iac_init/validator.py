@@ -4,18 +4,32 @@
 
 import os
 import re
-import time
+import json
+import hashlib
+import tempfile
 from ruamel import yaml
 
 from typing import Any, Dict, List, Optional
 
+import iac_init
 from iac_init.conf import settings
-from iac_init.yaml_conf.yaml import load_yaml_files
+from iac_init.yaml_conf.yaml import load_yaml_files, file_digest
+from iac_init.yaml_conf.data_index import (
+    clear_data_indexes,
+    scan_data_dir,
+    walk
+)
+from iac_init.scripts.cache_tool import cache_dir
 from iac_init.scripts.ssh_tool import check_ssh_connection
-from iac_init.scripts.apic_connecton_tool import apic_login
-from iac_init.scripts.cimc_precheck_tool import cimc_precheck
-from iac_init.scripts.telnet_tool import TelnetClient
-from iac_init.scripts.logging_tool import setup_logging
+from iac_init.scripts.apic_connecton_tool import wait_apic_cluster_ready
+from iac_init.scripts.cimc_precheck_tool import (
+    cimc_precheck,
+    new_precheck_report
+)
+from iac_init.scripts.telnet_tool import login_hosts
+from iac_init.scripts.tcp_scan_tool import scan_ports
+from iac_init.scripts.thread_tool import MyThread, run_in_pool
+from iac_init.scripts.logging_tool import setup_logging, format_table
 
 logger = setup_logging()
 
@@ -26,6 +40,8 @@ class Validator:
         self.data_path = data_path
         self.output = output
         self.global_policy = None
+        self.yaml_path = None
+        self.data_index = None
         self.errors: List[str] = []
         self._wrapped = self._validate_path
 
@@ -50,12 +66,59 @@ class Validator:
 
         return self._validate_yaml()
 
+    def _get_data_index(self):
+        """Index of the data directory, scanned once at first use."""
+        if self.data_index is None:
+            # Indexes of earlier validations may cover this directory with
+            # outdated sizes and mtimes
+            clear_data_indexes()
+            self.data_index = scan_data_dir(self.data_path)
+        return self.data_index
+
+    def _validation_manifest_path(self):
+        key = hashlib.sha256(
+            os.path.realpath(self.data_path).encode()).hexdigest()
+        return os.path.join(
+            cache_dir("validation"), "{}.json".format(key))
+
+    def _load_validation_manifest(self):
+        """Validation results of the previous run, by file path."""
+        if not settings.VALIDATION_MANIFEST:
+            return {}
+        try:
+            with open(self._validation_manifest_path()) as fh:
+                manifest = json.load(fh)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning("Cannot read validation manifest: {}".format(e))
+            return {}
+        # Validation rules may change with the tool version
+        if manifest.get("version") != iac_init.__version__:
+            return {}
+        return manifest.get("files", {})
+
+    def _save_validation_manifest(self, files):
+        if not settings.VALIDATION_MANIFEST:
+            return
+        try:
+            path = self._validation_manifest_path()
+            with tempfile.NamedTemporaryFile(
+                    "w", dir=os.path.dirname(path), delete=False) as fh:
+                json.dump(
+                    {"version": iac_init.__version__, "files": files}, fh)
+            os.replace(fh.name, path)
+        except Exception as e:
+            logger.warning("Cannot write validation manifest: {}".format(e))
+
     def _validate_syntax_file(self, file_path: str):
-        """Run syntactic validation for a single file"""
+        """Run syntactic validation for a single file
+
+        Returns the error messages added for the file.
+        """
+        errors = []
         filename = os.path.basename(file_path)
-        if os.path.isfile(file_path) \
-                and \
-                (".yaml" in filename or ".yml" in filename):
+        if ".yaml" in filename or ".yml" in filename:
             logger.info("Validated file: {} successfully.".format(filename))
 
             # YAML syntax validation
@@ -75,13 +138,40 @@ class Validator:
                 )
                 logger.error(msg)
                 self.errors.append(msg)
+                errors.append(msg)
+        return errors
 
     def _validate_yaml(self):
-        for dir, _, files in os.walk(self.data_path):
-            for filename in files:
-                self._validate_syntax_file(os.path.join(dir, filename))
-                if settings.DEFAULT_DATA_PATH == filename:
-                    self.global_policy = os.path.join(dir, filename)
+        # Files unchanged since the last run keep their validation result
+        previous = self._load_validation_manifest()
+        manifest = {}
+        for data_file in self._get_data_index().files:
+            digest = None
+            if ".yaml" in data_file.name or ".yml" in data_file.name:
+                try:
+                    digest = file_digest(data_file.path)
+                except OSError:
+                    pass
+            # Keyed by real path, however the data dir was spelled
+            path = os.path.realpath(data_file.path)
+            record = previous.get(path)
+            if digest and record and record["digest"] == digest:
+                logger.info("Validated file: {} unchanged.".format(
+                    data_file.name))
+                for msg in record["errors"]:
+                    logger.error(msg)
+                    self.errors.append(msg)
+                errors = record["errors"]
+            else:
+                errors = self._validate_syntax_file(data_file.path)
+            if digest:
+                manifest[path] = {
+                    "digest": digest,
+                    "errors": errors,
+                }
+            if settings.DEFAULT_DATA_PATH == data_file.name:
+                self.global_policy = data_file.path
+        self._save_validation_manifest(manifest)
         if self.global_policy:
             settings.global_policy = load_yaml_files([self.global_policy])
         else:
@@ -204,36 +294,112 @@ class Validator:
             self.errors.append(str(msg))
             return True
 
-    def validate_ssh_telnet_connection(self):
-        apic_error_msg = "Validation error: APIC CIMC SSH failed!\n"
-        apic_fail_list = []
+    def validate_tcp_reachability(self, cimc=False, apic=False,
+                                  console=False):
+        """Fast TCP connect scan of the selected devices."""
+        targets = []
+        if cimc:
+            targets += [(ip, port) for ip in self.cimc_address
+                        for port in (22, 443)]
+        if apic:
+            targets += [(ip, 443) for ip in self.apic_address]
+        if console:
+            targets += [(data[0], data[1]) for data in self.switch_list]
+
+        logger.info("Start TCP reachability prescan for {} host:port(s), "
+                    "timeout {}s".format(len(targets),
+                                         settings.PRESCAN_TIMEOUT))
+        results = scan_ports(
+            targets,
+            settings.PRESCAN_TIMEOUT,
+            settings.PRESCAN_ATTEMPTS,
+            settings.PRESCAN_MAX_CONNECTIONS
+        )
+
+        fail_list = [
+            "{}:{}({})".format(ip, port, result["error"])
+            for (ip, port), result in zip(targets, results)
+            if not result["result"]
+        ]
+        if fail_list:
+            msg = "Validation error: Below host:port(s) are unreachable!\n" \
+                  + ",".join(fail_list)
+            logger.error(msg)
+            self.errors.append(msg)
+            return True
+
+        logger.info("TCP reachability prescan validates successfully.")
+        return
 
-        for ip in self.cimc_address:
-            logger.info("Start SSH connection validation for {}, "
-                        "timeout 5 minutes".format(ip))
-            connection_state = check_ssh_connection(
-                ip,
-                self.apic_cimc_credential[0],
-                self.apic_cimc_credential[1]
+    def _login_consoles(self):
+        """Telnet login results of the switch consoles, failed on error."""
+        try:
+            return login_hosts(
+                self.switch_list,
+                self.aci_local_credential[0],
+                self.aci_local_credential[1],
+                settings.TELNET_TIMEOUT,
+                settings.PREFLIGHT_MAX_WORKERS
             )
-            if not connection_state:
-                apic_fail_list.append(ip)
+        except Exception as e:
+            logger.error("Switch Telnet validation failed: {}".format(e))
+            return [{"result": False, "elapsed": 0, "error": str(e)}
+                    for _ in self.switch_list]
 
+    def validate_ssh_telnet_connection(self):
+        apic_error_msg = "Validation error: APIC CIMC SSH failed!\n"
+        apic_fail_list = []
         switch_error_msg = "Validation error: Switch Telnet failed!\n"
         switch_fail_list = []
 
-        for data in self.switch_list:
-            logger.info("Start Telnet connection validation for {}:{}"
-                        .format(data[0], data[1]))
-            connection = TelnetClient(
-                data[0],
-                data[1],
-                self.aci_local_credential[0],
-                self.aci_local_credential[1]
-            )
-            connection_state = connection.login_host()
-            if not connection_state:
-                switch_fail_list.append("{}:{}".format(data[0], data[1]))
+        logger.info("Start SSH/Telnet connection validation for {} host(s), "
+                    "{} in parallel, SSH timeout {}s, Telnet timeout {}s"
+                    .format(len(self.cimc_address) + len(self.switch_list),
+                            settings.PREFLIGHT_MAX_WORKERS,
+                            settings.SSH_TIMEOUT,
+                            settings.TELNET_TIMEOUT))
+
+        # Consoles are driven from one event loop in the background
+        # while the CIMC SSH probes run in the thread pool.
+        telnet_thread = MyThread(target=self._login_consoles)
+        telnet_thread.start()
+        ssh_results = run_in_pool(
+            check_ssh_connection,
+            [(ip,
+              self.apic_cimc_credential[0],
+              self.apic_cimc_credential[1],
+              settings.SSH_TIMEOUT)
+             for ip in self.cimc_address],
+            settings.PREFLIGHT_MAX_WORKERS
+        )
+        telnet_thread.join()
+
+        probes = [("SSH", ip) for ip in self.cimc_address]
+        probes += [("Telnet", data[0], data[1]) for data in self.switch_list]
+        telnet_results = telnet_thread.get_result() or []
+        # Consoles without a result failed, none may go unchecked
+        telnet_results += [
+            {"result": False, "elapsed": 0, "error": "No result"}
+        ] * (len(self.switch_list) - len(telnet_results))
+        results = ssh_results + telnet_results
+
+        rows = []
+        for probe, result in zip(probes, results, strict=True):
+            host = ":".join(map(str, probe[1:]))
+            state = "OK" if result["result"] else "FAILED"
+            rows.append([host, probe[0], state,
+                         "{:.1f}s".format(result["elapsed"]),
+                         result["error"] or ""])
+            if result["result"]:
+                continue
+            if probe[0] == "SSH":
+                apic_fail_list.append(host)
+            else:
+                switch_fail_list.append(host)
+
+        logger.info("SSH/Telnet connection validation result:\n{}".format(
+            format_table(["Host", "Protocol", "State", "Time", "Error"], rows)
+        ))
 
         if apic_fail_list and switch_fail_list:
             apic_error_msg += ",".join(apic_fail_list)
@@ -265,38 +431,22 @@ class Validator:
         # Rudy: Need to update AAA login code later
         # (it's default domain at this moment)
         apic_error_msg = "Validatation error: APIC Login failed!\n"
-        apic_fail_list = []
-
-        for ip in self.apic_address:
-            start_time = time.time()
-            if apic_fail_list:
-                apic_fail_list = list[set(apic_fail_list)]
-                apic_error_msg += ",".join(apic_fail_list)
-                logger.error(apic_error_msg)
-                self.errors.append(apic_error_msg)
-                return True
 
-            i = 1
-            while True:
-                # Totally run 900 seconds every 3 seconds
-                # test if APIC could AAA login.
-                if time.time() - start_time >= 900:
-                    break
-                connection_state = apic_login(
-                    ip,
-                    self.aci_local_credential[0],
-                    self.aci_local_credential[1]
-                )
-                if not connection_state:
-                    apic_fail_list.append(ip)
-                    logger.info("Attempt to validate {} "
-                                "APIC Login Connection {}th,"
-                                " timeout 15 mins."
-                                .format(ip, i))
-                    i += 1
-                    time.sleep(3)
-                else:
-                    break
+        logger.info("Start APIC Login validation for {}, timeout {} mins."
+                    .format(",".join(self.apic_address),
+                            settings.APIC_LOGIN_TIMEOUT // 60))
+        result = wait_apic_cluster_ready(
+            self.apic_address,
+            self.aci_local_credential[0],
+            self.aci_local_credential[1],
+            settings.APIC_LOGIN_TIMEOUT
+        )
+        apic_fail_list = [ip for ip, state in result.items() if not state]
+        if apic_fail_list:
+            apic_error_msg += ",".join(apic_fail_list)
+            logger.error(apic_error_msg)
+            self.errors.append(apic_error_msg)
+            return True
 
         logger.info("APIC Login validates successfully.")
         return
@@ -318,10 +468,9 @@ class Validator:
         return self.choices
 
     def validate_yaml_exist(self, yamlfile):
-        for dir, _, files in os.walk(self.data_path):
-            for filename in files:
-                if yamlfile == filename:
-                    self.yaml_path = os.path.join(dir, filename)
+        data_file = self._get_data_index().find(yamlfile)
+        if data_file is not None:
+            self.yaml_path = data_file.path
         if self.yaml_path:
             msg = "YAML file {} validated successfully.".format(yamlfile)
             logger.info(msg)
@@ -337,12 +486,12 @@ class Validator:
         try:
             self.file_dir_list = []
             folder_path = os.path.join(self.data_path, yaml_dir)
-            if os.path.exists(folder_path) and os.path.isdir(folder_path):
-                for dir, _, files in os.walk(folder_path):
-                    for filename in files:
-                        option3_yaml_path = os.path.join(dir, filename)
-                        if option3_yaml_path:
-                            self.file_dir_list.append(option3_yaml_path)
+            self._get_data_index()
+            data_files = walk(folder_path)
+            if data_files is not None:
+                self.file_dir_list = [
+                    data_file.path for data_file in data_files
+                ]
             else:
                 msg = "Validation Error: Directory {} doesn't exist!"\
                     .format(folder_path)
@@ -367,20 +516,46 @@ class Validator:
     def validate_cimc_precheck(self):
         cimc_username = self.apic_cimc_credential[0]
         cimc_password = self.apic_cimc_credential[1]
-        result = {}
-        for cimc_ip in self.cimc_address:
-            error = cimc_precheck(cimc_ip, cimc_username, cimc_password)
-            result[cimc_ip] = error
+        reports = [new_precheck_report() for _ in self.cimc_address]
+        results = run_in_pool(
+            cimc_precheck,
+            [(cimc_ip, cimc_username, cimc_password, report)
+             for cimc_ip, report in zip(self.cimc_address, reports)],
+            settings.CIMC_PRECHECK_MAX_WORKERS
+        )
 
         result_state = True
-        for cimc_ip, test_result in result.items():
-            if test_result:
+        rows = []
+        for cimc_ip, report, result in zip(
+                self.cimc_address, reports, results):
+            if result["result"]:
                 msg = "APIC CIMC {} pre-check successfully.\n".format(cimc_ip)
                 logger.info(msg)
             else:
                 result_state = False
                 msg = "APIC CIMC {} pre-check failed!\n".format(cimc_ip)
                 logger.error(msg)
+            rows.append([
+                cimc_ip,
+                "OK" if result["result"] else "FAILED",
+                report["firmware"] or "-",
+                report["tpm"] or "-",
+                "-" if report["faults"] is None else "{} {}".format(
+                    report["faults"],
+                    ",".join("{}={}".format(*item)
+                             for item in report["fault_severity"].items())
+                ).strip(),
+                ",".join(report["cleaned"]) or "-",
+                "{:.1f}s".format(result["elapsed"]),
+                " ".join("{}={:.1f}s".format(stage, seconds)
+                         for stage, seconds in report["timings"].items()),
+            ])
+
+        logger.info("APIC CIMC pre-check report:\n{}".format(format_table(
+            ["CIMC", "State", "Firmware", "TPM", "Faults", "Cleaned",
+             "Time", "Stages"],
+            rows
+        )))
 
         if result_state:
             return False
@@ -394,7 +569,7 @@ class Validator:
 
     def write_output(self, input_paths: List[str], path: str):
         if self.data is None:
-            self.data = load_yaml_files(input_paths)
+            self.data = load_yaml_files(input_paths, round_trip=True)
         try:
             with open(path, "w") as fh:
                 y = yaml.YAML()
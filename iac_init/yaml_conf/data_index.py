@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Wang Xiao <xiawang3@cisco.com>
+
+import os
+import stat
+from typing import Dict, List, NamedTuple, Optional, Set
+
+from iac_init.scripts.logging_tool import setup_logging
+
+logger = setup_logging()
+
+
+class DataFile(NamedTuple):
+    path: str
+    relpath: str
+    name: str
+    ext: str
+    size: int
+    mtime_ns: int
+
+
+class DataIndex:
+    """
+    Regular files of a data directory, read in a single os.scandir pass.
+
+    Files are kept in os.walk order, so lookups return what walking the
+    directory would have returned. Size and mtime are those at scan time.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.abs_root = os.path.abspath(root)
+        self.files: List[DataFile] = []
+        self.dirs: Set[str] = set()
+        self._by_name: Dict[str, List[DataFile]] = {}
+        self._by_path: Dict[str, DataFile] = {}
+        self._scan(root, "")
+
+    def _scan(self, path: str, relpath: str) -> None:
+        self.dirs.add(relpath)
+        try:
+            with os.scandir(path) as it:
+                entries = list(it)
+        except OSError as e:
+            logger.warning("Could not scan directory {}: {}".format(path, e))
+            return
+
+        subdirs = []
+        for entry in entries:
+            entry_relpath = os.path.join(relpath, entry.name)
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                # Like os.walk, symlinks to directories are not followed
+                if not entry.is_symlink():
+                    subdirs.append((entry.path, entry_relpath))
+                continue
+            try:
+                entry_stat = entry.stat()
+            except OSError:
+                continue
+            if not stat.S_ISREG(entry_stat.st_mode):
+                continue
+            data_file = DataFile(
+                path=entry.path,
+                relpath=entry_relpath,
+                name=entry.name,
+                ext=os.path.splitext(entry.name)[1],
+                size=entry_stat.st_size,
+                mtime_ns=entry_stat.st_mtime_ns,
+            )
+            self.files.append(data_file)
+            self._by_name.setdefault(entry.name, []).append(data_file)
+            self._by_path[os.path.join(self.abs_root, entry_relpath)] = \
+                data_file
+
+        for subdir_path, subdir_relpath in subdirs:
+            self._scan(subdir_path, subdir_relpath)
+
+    def relpath(self, path: str) -> Optional[str]:
+        """Path relative to the root, None if outside of it."""
+        path = os.path.abspath(path)
+        if path == self.abs_root:
+            return ""
+        if path.startswith(self.abs_root + os.sep):
+            return path[len(self.abs_root) + 1:]
+        return None
+
+    def get(self, path: str) -> Optional[DataFile]:
+        return self._by_path.get(os.path.abspath(path))
+
+    def find(self, name: str) -> Optional[DataFile]:
+        """Last file called name in walk order."""
+        files = self._by_name.get(name)
+        return files[-1] if files else None
+
+    def walk(self, path: str) -> Optional[List[DataFile]]:
+        """Files below directory path, None if it is not an indexed dir."""
+        relpath = self.relpath(path)
+        if relpath is None or relpath not in self.dirs:
+            return None
+        if not relpath:
+            return list(self.files)
+        prefix = relpath + os.sep
+        return [f for f in self.files if f.relpath.startswith(prefix)]
+
+
+# Indexes by absolute root, shared by the validator and the YAML loaders
+_indexes: Dict[str, DataIndex] = {}
+
+
+def scan_data_dir(root: str) -> DataIndex:
+    """Index the data directory root, replacing an earlier index of it."""
+    index = DataIndex(root)
+    _indexes[index.abs_root] = index
+    logger.info("Indexed {} files in {}".format(len(index.files), root))
+    return index
+
+
+def lookup(path: str) -> Optional[DataIndex]:
+    """Index covering path, if any."""
+    for index in _indexes.values():
+        if index.relpath(path) is not None:
+            return index
+    return None
+
+
+def get_file(path: str) -> Optional[DataFile]:
+    index = lookup(path)
+    return index.get(path) if index else None
+
+
+def walk(path: str) -> Optional[List[DataFile]]:
+    """Files below directory path, scanning it if no index covers it.
+
+    None if path is not a directory.
+    """
+    index = lookup(path)
+    if index is not None:
+        files = index.walk(path)
+        if files is not None:
+            return files
+    if not os.path.isdir(path):
+        return None
+    return DataIndex(path).files
+
+
+def clear_data_indexes() -> None:
+    _indexes.clear()
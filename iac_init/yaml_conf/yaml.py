@@ -3,12 +3,21 @@
 # Copyright: (c) 2024, Wang Xiao <xiawang3@cisco.com>
 
 import os
-import subprocess
-import importlib.util
-from typing import Any, Dict, List
+import copy
+import sys
+import hashlib
+import marshal
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
 
+import iac_init
 from ruamel import yaml
+from iac_init.conf import settings
+from iac_init.yaml_conf import data_index
+from iac_init.scripts.cache_tool import cache_dir, check_cache_file
 from iac_init.scripts.logging_tool import setup_logging
+from iac_init.scripts.vault_tool import decrypt_vault
 
 logger = setup_logging()
 
@@ -20,29 +29,15 @@ class VaultTag(yaml.YAMLObject):
         self.value = v
 
     def __repr__(self) -> str:
-        spec = importlib.util.find_spec("iac_validate.ansible_vault")
-        if spec:
-            if "ANSIBLE_VAULT_ID" in os.environ:
-                vault_id = os.environ["ANSIBLE_VAULT_ID"] \
-                           + "@" \
-                           + str(spec.origin)
-            else:
-                vault_id = str(spec.origin)
-            t = subprocess.check_output(
-                [
-                    "ansible-vault",
-                    "decrypt",
-                    "--vault-id",
-                    vault_id,
-                ],
-                input=self.value.encode(),
-            )
-            return t.decode()
-        return ""
+        plaintext = decrypt_vault([self.value])[self.value]
+        if isinstance(plaintext, Exception):
+            raise plaintext
+        return plaintext
 
     @classmethod
-    def from_yaml(cls, loader: Any, node: Any) -> str:
-        return str(cls(node.value))
+    def from_yaml(cls, loader: Any, node: Any) -> "VaultTag":
+        # Decrypted after loading, see _resolve_vault_tags
+        return cls(node.value)
 
 
 class EnvTag(yaml.YAMLObject):
@@ -62,85 +57,665 @@ class EnvTag(yaml.YAMLObject):
         return str(cls(node.value))
 
 
-def load_yaml_files(paths: List[str]) -> Dict[str, Any]:
-    """Load all YAML files from a provided directory."""
+# Parsed YAML documents by absolute path, with the (size, mtime) they
+# were parsed at, shared by every caller in the process.
+_document_cache: Dict[str, Dict[str, Any]] = {}
 
-    def _load_file(file_path: str, data: Dict[str, Any]) -> None:
-        with open(file_path, "r") as file:
-            if ".yaml" in file_path or ".yml" in file_path:
-                data_yaml = file.read()
-                y = yaml.YAML()
-                y.preserve_quotes = True  # type: ignore
-                y.register_class(VaultTag)
-                y.register_class(EnvTag)
-                dict = y.load(data_yaml)
-                merge_dict(dict, data)
+_MISSING = object()
 
-    result: Dict[str, Any] = {}
+
+# On-disk cache directory by (CACHE_DIR, version), None if unusable
+_disk_cache_dirs: Dict[Tuple[str, str], Optional[str]] = {}
+
+
+def _disk_cache_dir() -> Optional[str]:
+    key = (settings.CACHE_DIR, iac_init.__version__)
+    if key not in _disk_cache_dirs:
+        try:
+            # marshal data depends on the Python version
+            _disk_cache_dirs[key] = cache_dir(
+                "yaml", iac_init.__version__,
+                "py{}{}".format(*sys.version_info[:2]))
+        except OSError as e:
+            logger.warning("YAML cache disabled: {}".format(e))
+            _disk_cache_dirs[key] = None
+    return _disk_cache_dirs[key]
+
+
+def _to_plain(data: Any, memo: Dict[int, Any]) -> Any:
+    """data with !vault tags as ("!vault", ciphertext) tuples."""
+    if type(data) is VaultTag:
+        return ("!vault", data.value)
+    if type(data) is tuple:
+        raise TypeError("tuples cannot be cached next to !vault tags")
+    if type(data) not in (dict, list):
+        return data
+    if id(data) in memo:
+        return memo[id(data)]
+    if type(data) is dict:
+        result: Any = memo.setdefault(id(data), {})
+        for key, value in data.items():
+            result[key] = _to_plain(value, memo)
+    else:
+        result = memo.setdefault(id(data), [])
+        result.extend(_to_plain(value, memo) for value in data)
+    return result
+
+
+def _from_plain(data: Any, memo: Dict[int, Any]) -> Any:
+    """Reverse of _to_plain."""
+    if type(data) is tuple:
+        return VaultTag(data[1])
+    if type(data) not in (dict, list):
+        return data
+    if id(data) in memo:
+        return memo[id(data)]
+    if type(data) is dict:
+        result: Any = memo.setdefault(id(data), {})
+        for key, value in data.items():
+            result[key] = _from_plain(value, memo)
+    else:
+        result = memo.setdefault(id(data), [])
+        result.extend(_from_plain(value, memo) for value in data)
+    return result
+
+
+def _read_disk_cache(kind: str, digest: str, vault: bool = False) -> Any:
+    if not settings.YAML_DISK_CACHE:
+        return _MISSING
+    directory = _disk_cache_dir()
+    if directory is None:
+        return _MISSING
+    try:
+        path = os.path.join(directory, "{}-{}".format(kind, digest))
+        with open(path, "rb") as file:
+            check_cache_file(file)
+            data = marshal.loads(file.read())
+    except FileNotFoundError:
+        return _MISSING
+    except Exception as e:
+        logger.warning("Could not read YAML cache {}: {}".format(digest, e))
+        return _MISSING
+    return _from_plain(data, {}) if vault else data
+
+
+def _write_disk_cache(
+        kind: str, digest: str, data: Any, vault: bool = False
+) -> None:
+    """
+    Store data with marshal, which only handles plain types: round-trip
+    documents and values such as dates are not cached.
+    """
+    if not settings.YAML_DISK_CACHE:
+        return
+    directory = _disk_cache_dir()
+    if directory is None:
+        return
+    try:
+        content = marshal.dumps(_to_plain(data, {}) if vault else data)
+    except (TypeError, ValueError):
+        return
+    try:
+        with tempfile.NamedTemporaryFile(dir=directory, delete=False) as file:
+            file.write(content)
+        os.replace(file.name,
+                   os.path.join(directory, "{}-{}".format(kind, digest)))
+    except Exception as e:
+        logger.warning("Could not write YAML cache {}: {}".format(digest, e))
+
+
+def _load_mode(round_trip: bool) -> str:
+    """Parser used for a load: "rt" (round-trip) or "safe"."""
+    if round_trip or not settings.YAML_FAST_LOAD:
+        return "rt"
+    return "safe"
+
+
+def _cache_entry(
+        file_path: str, mode: Optional[str] = None
+) -> Dict[str, Any]:
+    """Return the cache entry of a YAML file, (re)reading it if changed.
+
+    With a load mode, the document parsed in that mode is added to the
+    entry. Files using !env tags are resolved at load time, so they are
+    never written to the on-disk cache. !vault tags are kept encrypted in
+    the parsed documents.
+    """
+    path = os.path.abspath(file_path)
+    data_file = data_index.get_file(path)
+    if data_file is not None:
+        signature = (data_file.size, data_file.mtime_ns)
+    else:
+        stat = os.stat(path)
+        signature = (stat.st_size, stat.st_mtime_ns)
+    entry = _document_cache.get(path)
+    content = None
+    if entry is None or entry["signature"] != signature:
+        with open(path, "rb") as file:
+            content = file.read()
+        entry = {
+            "signature": signature,
+            "digest": hashlib.sha256(content).hexdigest(),
+            "persistent": b"!env" not in content,
+            "vault": b"!vault" in content,
+            "documents": {},
+        }
+        _document_cache[path] = entry
+    if mode is None or mode in entry["documents"]:
+        return entry
+    if content is None:
+        with open(path, "rb") as file:
+            content = file.read()
+
+    document = _MISSING
+    if entry["persistent"]:
+        document = _read_disk_cache(
+            "doc-" + mode, entry["digest"], entry["vault"])
+    if document is _MISSING:
+        document = _parse_yaml(content, mode)
+        if entry["persistent"]:
+            _write_disk_cache(
+                "doc-" + mode, entry["digest"], document, entry["vault"])
+    entry["documents"][mode] = document
+    return entry
+
+
+def file_digest(file_path: str) -> str:
+    """SHA-256 of the content of a file, computed once while unchanged."""
+    return _cache_entry(file_path)["digest"]
+
+
+def forget_file(file_path: str) -> None:
+    """Drop the cached entry of a file being replaced or removed."""
+    _document_cache.pop(os.path.abspath(file_path), None)
+
+
+def _parse_yaml(content: bytes, mode: str = "rt") -> Any:
+    if mode == "rt":
+        y = yaml.YAML()
+        y.preserve_quotes = True  # type: ignore
+    else:
+        # Plain dict/list data, parsed by libyaml if ruamel.yaml.clib
+        # is installed
+        y = yaml.YAML(typ="safe")
+    y.register_class(VaultTag)
+    y.register_class(EnvTag)
+    return y.load(content.decode())
+
+
+def _parse_yaml_file(file_path: str, mode: str = "rt") -> Any:
+    with open(file_path, "rb") as file:
+        return _parse_yaml(file.read(), mode)
+
+
+def _preload_documents(
+        file_paths: List[str], processes: int, mode: str
+) -> None:
+    """Parse the files missing from the cache in a process pool.
+
+    Files failing to parse are left out, so loading them again in this
+    process reports the error exactly as a sequential load would.
+    """
+    pending = []
+    for file_path in file_paths:
+        try:
+            entry = _cache_entry(file_path)
+        except OSError:
+            continue
+        if mode in entry["documents"]:
+            continue
+        if entry["persistent"]:
+            document = _read_disk_cache(
+                "doc-" + mode, entry["digest"], entry["vault"])
+            if document is not _MISSING:
+                entry["documents"][mode] = document
+                continue
+        pending.append((file_path, entry))
+
+    if len(pending) < max(2, settings.YAML_PARALLEL_LOAD_THRESHOLD):
+        return
+
+    logger.info("Parsing {} YAML files with {} processes".format(
+        len(pending), processes))
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [
+            executor.submit(_parse_yaml_file, file_path, mode)
+            for file_path, _ in pending
+        ]
+        for (file_path, entry), future in zip(pending, futures):
+            try:
+                document = future.result()
+            except Exception:
+                continue
+            entry["documents"][mode] = document
+            if entry["persistent"]:
+                _write_disk_cache(
+                    "doc-" + mode, entry["digest"], document, entry["vault"])
+
+
+def _load_document(file_path: str, mode: str = "rt") -> Any:
+    """Parse a YAML file, or return the cached document if unchanged.
+
+    The returned document is shared and must not be modified.
+    """
+    return _cache_entry(file_path, mode)["documents"][mode]
+
+
+def _copy_document(file_path: str, mode: str) -> Tuple[Any, bool]:
+    """Copy of the cached document, and whether it may hold !vault tags."""
+    entry = _cache_entry(file_path, mode)
+    # merge_dict links and modifies nodes of the merged documents,
+    # so callers always get their own copy of the cached document.
+    return copy.deepcopy(entry["documents"][mode]), entry["vault"]
+
+
+def _find_vault_tags(data: Any, ciphertexts: Dict[str, None]) -> None:
+    if isinstance(data, VaultTag):
+        ciphertexts[data.value] = None
+    elif isinstance(data, dict):
+        for value in data.values():
+            _find_vault_tags(value, ciphertexts)
+    elif isinstance(data, list):
+        for value in data:
+            _find_vault_tags(value, ciphertexts)
+
+
+def _resolve_vault_tags(data: Any, plaintexts: Dict[str, Any]) -> Any:
+    """Replace !vault tags in data by their plaintext from plaintexts."""
+    if isinstance(data, VaultTag):
+        plaintext = plaintexts[data.value]
+        if isinstance(plaintext, Exception):
+            raise plaintext
+        return plaintext
+    if isinstance(data, dict):
+        for key, value in list(data.items()):
+            data[key] = _resolve_vault_tags(value, plaintexts)
+    elif isinstance(data, list):
+        for i, value in enumerate(data):
+            data[i] = _resolve_vault_tags(value, plaintexts)
+    return data
+
+
+def clear_yaml_cache() -> None:
+    _document_cache.clear()
+
+
+def _merged_cache_key(file_paths: List[str], mode: str) -> Optional[str]:
+    """Key of the merged result of several files, None if not cacheable."""
+    if not settings.YAML_DISK_CACHE or len(file_paths) < 2:
+        return None
+    digest = hashlib.sha256()
+    for file_path in file_paths:
+        try:
+            entry = _cache_entry(file_path)
+        except OSError:
+            return None
+        # the merged result holds decrypted !vault values
+        if not entry["persistent"] or entry["vault"]:
+            return None
+        # Same files, in the same order, with the same content
+        digest.update(os.path.abspath(file_path).encode() + b"\0")
+        digest.update(entry["digest"].encode() + b"\0")
+    return "{}-{}".format(mode, digest.hexdigest())
+
+
+def load_yaml_files(
+        paths: List[str],
+        processes: Optional[int] = None,
+        round_trip: bool = False
+) -> Dict[str, Any]:
+    """Load all YAML files from a provided directory.
+
+    Large directories are parsed by up to processes worker processes
+    (YAML_LOAD_PROCESSES by default), then merged in directory order.
+    Files are parsed into plain data unless round_trip is set.
+    """
+
+    def _is_yaml(file_path: str) -> bool:
+        return ".yaml" in file_path or ".yml" in file_path
+
+    file_paths = []
     for path in paths:
-        if os.path.isfile(path):
-            _load_file(path, result)
+        if data_index.get_file(path) or os.path.isfile(path):
+            if _is_yaml(path):
+                file_paths.append((path, True))
         else:
-            for dir, subdir, files in os.walk(path):
-                for filename in files:
-                    try:
-                        _load_file(dir + os.path.sep + filename, result)
-                    except:  # noqa: E722
-                        logger.warning(
-                            "Could not load file: {}".format(filename)
-                        )
+            for data_file in data_index.walk(path) or []:
+                if _is_yaml(data_file.path):
+                    file_paths.append((data_file.path, False))
+
+    # Merged result of the same files, parsed and merged by an earlier run
+    mode = _load_mode(round_trip)
+    cache_key = _merged_cache_key(
+        [file_path for file_path, _ in file_paths], mode)
+    if cache_key:
+        result = _read_disk_cache("merged", cache_key)
+        if result is not _MISSING:
+            return result
+
+    if processes is None:
+        processes = settings.YAML_LOAD_PROCESSES
+    if processes > 1:
+        _preload_documents([file_path for file_path, _ in file_paths],
+                           processes, mode)
+
+    documents = []
+    ciphertexts: Dict[str, None] = {}
+    for file_path, _ in file_paths:
+        try:
+            document, vault = _copy_document(file_path, mode)
+        except Exception as e:
+            documents.append((None, False, e))
+            continue
+        if vault:
+            _find_vault_tags(document, ciphertexts)
+        documents.append((document, vault, None))
+    # !vault values of all files are decrypted together, once each
+    plaintexts = decrypt_vault(ciphertexts) if ciphertexts else {}
+
+    result: Dict[str, Any] = {}
+    # List indexes are kept across files, merging each file is near-linear
+    indexes = _MergeIndexes()
+
+    def _merge(document: Any, vault: bool, error: Optional[Exception]):
+        if error is not None:
+            raise error
+        if vault:
+            document = _resolve_vault_tags(document, plaintexts)
+        _merge_dict(document, result, True, indexes)
+
+    complete = True
+    for (file_path, strict), loaded in zip(file_paths, documents):
+        if strict:
+            _merge(*loaded)
+            continue
+        try:
+            _merge(*loaded)
+        except:  # noqa: E722
+            # a partial merge may have left indexes out of date
+            indexes.clear()
+            complete = False
+            logger.warning(
+                "Could not load file: {}".format(os.path.basename(file_path))
+            )
+
+    if cache_key and complete:
+        _write_disk_cache("merged", cache_key, result)
     return result
 
 
-def merge_list_item(
-    source_item: Any, destination: List[Any], merge_list_items: bool = True
+def _is_container(value: Any) -> bool:
+    return isinstance(value, dict) or isinstance(value, list)
+
+
+def _key_sets(item: Dict[Any, Any]) -> Tuple[frozenset, frozenset]:
+    """Keys of a dict with primitive values and with dict/list values."""
+    primitives, containers = [], []
+    for k, v in item.items():
+        (containers if _is_container(v) else primitives).append(k)
+    return frozenset(primitives), frozenset(containers)
+
+
+def _key_values(item: Dict[Any, Any], keys: Tuple[Any, ...]) -> Tuple:
+    """Hashable values of keys in item, TypeError if not indexable."""
+    values = tuple(item[k] for k in keys)
+    hash(values)
+    for value in values:
+        # NaN never equals itself but a tuple of the same NaN object does
+        if value != value:
+            raise TypeError("unorderable value")
+    return values
+
+
+def _items_match(source_item: Dict[Any, Any], dest_item: Any) -> bool:
+    """Whether source_item is to be merged into dest_item."""
+    match = True
+    comparison = False
+    unique_source = False
+    unique_dest = False
+    for k, v in source_item.items():
+        if isinstance(v, dict) or isinstance(v, list):
+            continue
+        if k in dest_item and v == dest_item[k]:
+            comparison = True
+            continue
+        if k not in dest_item:
+            unique_source = True
+            continue
+        comparison = True
+        match = False
+    for k, v in dest_item.items():
+        if isinstance(v, dict) or isinstance(v, list):
+            continue
+        if k in source_item and v == source_item[k]:
+            comparison = True
+            continue
+        if k not in source_item:
+            unique_dest = True
+            continue
+        comparison = True
+        match = False
+    return comparison and match and not (unique_source and unique_dest)
+
+
+class _ListIndex:
+    """Hash index of the items of a list that is merged into.
+
+    Dict items are grouped by their primitive and container key sets.
+    An incoming dict can only match items of groups whose key sets are
+    compatible with its own, and within such a group exactly the items
+    with equal values on the shared primitive keys match. Looking those
+    up per group gives the same first match as _items_match against
+    every item in list order.
+    """
+
+    def __init__(
+            self, items: List[Any], holders: Dict[int, List["_ListIndex"]]
+    ) -> None:
+        self.items = items
+        self.holders = holders
+        self.reset()
+
+    def reset(self) -> None:
+        self.size = 0
+        # False once dict lookups have to fall back to the linear search
+        self.usable = True
+        # Hashable scalar items, None once an unhashable one is added
+        self.scalars: Optional[set] = set()
+        self.key_sets: Dict[int, Tuple[frozenset, frozenset]] = {}
+        self.groups: Dict[Tuple[frozenset, frozenset], Tuple[set, Dict]] = {}
+        self.update()
+
+    def update(self) -> None:
+        """Index the items appended since the last update."""
+        if len(self.items) < self.size:
+            self.reset()
+            return
+        for position in range(self.size, len(self.items)):
+            self._add(position)
+        self.size = len(self.items)
+
+    def _add(self, position: int, hold: bool = True) -> None:
+        item = self.items[position]
+        if not isinstance(item, dict):
+            # dict lookups would compare against this item
+            self.usable = False
+            if self.scalars is not None and not isinstance(item, list):
+                try:
+                    self.scalars.add(item)
+                except TypeError:
+                    self.scalars = None
+            return
+        if not self.usable:
+            return
+        key_set = _key_sets(item)
+        positions, projections = self.groups.setdefault(key_set, (set(), {}))
+        try:
+            for keys, table in projections.values():
+                table.setdefault(_key_values(item, keys), []).append(position)
+        except TypeError:
+            self.usable = False
+            return
+        positions.add(position)
+        self.key_sets[position] = key_set
+        if hold:
+            self.holders.setdefault(id(item), []).append(self)
+
+    def refresh(self, position: int) -> None:
+        """Re-index the item at position after it was merged into."""
+        if not self.usable:
+            return
+        item = self.items[position]
+        key_set = self.key_sets[position]
+        if _key_sets(item) == key_set:
+            # merging only adds keys, existing primitive values stay equal
+            return
+        positions, projections = self.groups[key_set]
+        positions.discard(position)
+        try:
+            for keys, table in projections.values():
+                values = _key_values(item, keys)
+                table[values].remove(position)
+                if not table[values]:
+                    del table[values]
+        except (TypeError, KeyError, ValueError):
+            self.usable = False
+            return
+        if not positions:
+            del self.groups[key_set]
+        self._add(position, hold=False)
+
+    def find(self, source_item: Dict[Any, Any]) -> Optional[int]:
+        """Position of the first matching item, -1 if there is none.
+
+        None if the index cannot tell, e.g. for unhashable values.
+        """
+        if not self.usable:
+            return None
+        primitives, containers = _key_sets(source_item)
+        found = -1
+        for key_set, (positions, projections) in self.groups.items():
+            dest_primitives, dest_containers = key_set
+            shared = primitives & dest_primitives
+            if (not shared
+                    or primitives & dest_containers
+                    or dest_primitives & containers
+                    or not (primitives <= dest_primitives
+                            or dest_primitives <= primitives)):
+                continue
+            if shared not in projections:
+                keys = tuple(shared)
+                table: Dict[Tuple, List[int]] = {}
+                try:
+                    for i in positions:
+                        table.setdefault(
+                            _key_values(self.items[i], keys), []
+                        ).append(i)
+                except TypeError:
+                    self.usable = False
+                    return None
+                projections[shared] = (keys, table)
+            keys, table = projections[shared]
+            try:
+                matches = table.get(_key_values(source_item, keys))
+            except TypeError:
+                return None
+            if matches:
+                position = min(matches)
+                if found < 0 or position < found:
+                    found = position
+        return found
+
+    def contains(self, source_item: Any) -> bool:
+        if self.scalars is not None and not _is_container(source_item):
+            try:
+                return source_item in self.scalars
+            except TypeError:
+                pass
+        return source_item in self.items
+
+
+class _MergeIndexes:
+    """List indexes of a merge, by id() of the list.
+
+    A dict item may be shared through YAML aliases by several lists, or
+    by a list and a mapping. Whenever such an item is merged into, other
+    than through the index of the list it was matched in, every index
+    holding it is dropped and built again on next use.
+    """
+
+    def __init__(self) -> None:
+        self.lists: Dict[int, _ListIndex] = {}
+        # Indexes holding a dict item, once per position, by id() of item
+        self.holders: Dict[int, List[_ListIndex]] = {}
+
+    def get(self, destination: List[Any]) -> _ListIndex:
+        index = self.lists.get(id(destination))
+        if index is None or index.items is not destination:
+            index = self.lists[id(destination)] = _ListIndex(
+                destination, self.holders)
+        else:
+            index.update()
+        return index
+
+    def changing(
+            self, item: Dict[Any, Any], owner: Optional[_ListIndex] = None
+    ) -> None:
+        """Drop the indexes holding item, except once for owner."""
+        held = self.holders.get(id(item))
+        if not held:
+            return
+        for index in held:
+            if index is owner:
+                # owner refreshes the position it matched itself
+                owner = None
+            elif self.lists.get(id(index.items)) is index:
+                del self.lists[id(index.items)]
+        self.holders[id(item)] = [
+            index for index in held
+            if self.lists.get(id(index.items)) is index
+        ]
+
+    def clear(self) -> None:
+        self.lists.clear()
+        self.holders.clear()
+
+
+def _merge_list_item(
+        source_item: Any,
+        destination: List[Any],
+        merge_list_items: bool,
+        indexes: _MergeIndexes
 ) -> None:
-    """Merge items into list."""
+    index = indexes.get(destination)
     if isinstance(source_item, dict) and merge_list_items:
         # check if we have an item in destination with matching primitives
-        for dest_item in destination:
-            match = True
-            comparison = False
-            unique_source = False
-            unique_dest = False
-            for k, v in source_item.items():
-                if isinstance(v, dict) or isinstance(v, list):
-                    continue
-                if k in dest_item and v == dest_item[k]:
-                    comparison = True
-                    continue
-                if k not in dest_item:
-                    unique_source = True
-                    continue
-                comparison = True
-                match = False
-            for k, v in dest_item.items():
-                if isinstance(v, dict) or isinstance(v, list):
-                    continue
-                if k in source_item and v == source_item[k]:
-                    comparison = True
-                    continue
-                if k not in source_item:
-                    unique_dest = True
-                    continue
-                comparison = True
-                match = False
-            if comparison and match and not (unique_source and unique_dest):
-                merge_dict(source_item, dest_item, merge_list_items)
-                return
-    elif source_item in destination:
+        position = index.find(source_item)
+        if position is None:
+            position = next(
+                (i for i, dest_item in enumerate(destination)
+                 if _items_match(source_item, dest_item)), -1)
+        if position >= 0:
+            _merge_dict(source_item, destination[position],
+                        merge_list_items, indexes, index)
+            index.refresh(position)
+            return
+    elif index.contains(source_item):
         return
     destination.append(source_item)
+    index.update()
 
 
-def merge_dict(
+def _merge_dict(
         source: Dict[Any, Any],
         destination: Dict[Any, Any],
-        merge_list_items: bool = True
+        merge_list_items: bool,
+        indexes: _MergeIndexes,
+        owner: Optional[_ListIndex] = None
 ) -> Dict[Any, Any]:
-    """Merge two nested dict/list structures."""
     if not source:
         return destination
+    indexes.changing(destination, owner)
     for key, value in source.items():
         if isinstance(value, dict):
             # get node or create one
@@ -148,13 +723,36 @@ def merge_dict(
             if node is None:
                 destination[key] = value
             else:
-                merge_dict(value, node, merge_list_items)
+                _merge_dict(value, node, merge_list_items, indexes)
         elif isinstance(value, list):
             if key not in destination:
                 destination[key] = value
             if isinstance(destination[key], list):
                 for i in value:
-                    merge_list_item(i, destination[key], merge_list_items)
+                    _merge_list_item(i, destination[key], merge_list_items,
+                                     indexes)
         else:
             destination[key] = value
     return destination
+
+
+def merge_list_item(
+    source_item: Any, destination: List[Any], merge_list_items: bool = True
+) -> None:
+    """Merge items into list."""
+    _merge_list_item(source_item, destination, merge_list_items,
+                     _MergeIndexes())
+
+
+def merge_dict(
+        source: Dict[Any, Any],
+        destination: Dict[Any, Any],
+        merge_list_items: bool = True
+) -> Dict[Any, Any]:
+    """Merge two nested dict/list structures.
+
+    Lists are merged through hash indexes on the primitive values of their
+    items, so merging large lists takes near-linear time.
+    """
+    return _merge_dict(source, destination, merge_list_items,
+                       _MergeIndexes())
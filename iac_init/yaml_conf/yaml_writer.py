@@ -4,17 +4,283 @@
 
 import json
 import os
+import time
+import hashlib
+import tempfile
 import pathlib
 import shutil
+import stat
 
 from . import yaml
-from typing import Any, Dict, List
-from jinja2 import ChainableUndefined, Environment, FileSystemLoader
+from collections import Counter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from jinja2 import (
+    BytecodeCache,
+    ChainableUndefined,
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    StrictUndefined
+)
+import iac_init
+from iac_init.conf import settings
+from iac_init.scripts.cache_tool import cache_dir
+from iac_init.scripts.copy_tool import copy_file
+from iac_init.scripts.thread_tool import run_in_pool
 from iac_init.scripts.logging_tool import setup_logging
 
 logger = setup_logging()
 
 
+def _bytecode_cache(kind: str) -> Optional[BytecodeCache]:
+    """
+    On-disk cache of compiled templates, keyed by tool version and by
+    kind of environment.
+
+    Jinja checks the template source checksum itself, so changed
+    templates are compiled again, but not the environment options the
+    code was compiled with.
+    """
+    if not settings.TEMPLATE_BYTECODE_CACHE:
+        return None
+    try:
+        # Compiled templates are loaded as code, keep them private
+        directory = cache_dir("jinja", iac_init.__version__, kind)
+    except OSError as e:
+        logger.warning("Cannot create template cache in {}: {}"
+                       .format(settings.CACHE_DIR, e))
+        return None
+    return FileSystemBytecodeCache(directory)
+
+
+def _create_environment(templates_path: str) -> Environment:
+    return Environment(
+        loader=FileSystemLoader(templates_path),
+        undefined=ChainableUndefined,
+        lstrip_blocks=True,
+        trim_blocks=True,
+        bytecode_cache=_bytecode_cache("yaml"),
+    )
+
+
+def _render(
+        env: Environment,
+        template_path: str,
+        output_path: str,
+        context: Dict[str, Any],
+        **kwargs: Any
+) -> str:
+    """Render template_path to output_path, without the .j2 extension."""
+    # create output directory if it does not exist yet
+    pathlib.Path(os.path.dirname(output_path))\
+        .mkdir(parents=True, exist_ok=True)
+
+    template = env.get_template(template_path)
+    # Stream the output, the rendered file is never held in memory
+    lines = _clean_lines(_split_lines(template.generate(context, **kwargs)))
+
+    output_path = output_path.replace('.j2', '')
+    temporary = _temporary_path(output_path)
+    try:
+        with open(temporary, "w", buffering=_WRITE_BUFFER_SIZE) as file:
+            for index, line in enumerate(lines):
+                if index:
+                    file.write(os.linesep)
+                file.write(line)
+        return _install(temporary, output_path)
+    finally:
+        if os.path.lexists(temporary):
+            os.remove(temporary)
+
+
+def _finalize(value: Any) -> Any:
+    # Ansible renders None as an empty string
+    return "" if value is None else value
+
+
+def _create_script_environment(templates_path: str) -> Environment:
+    """Environment rendering like the Ansible template module defaults."""
+    return Environment(
+        loader=FileSystemLoader(templates_path),
+        undefined=StrictUndefined,
+        trim_blocks=True,
+        keep_trailing_newline=True,
+        finalize=_finalize,
+        bytecode_cache=_bytecode_cache("script"),
+    )
+
+
+def _render_script(
+        env: Environment,
+        template_path: str,
+        output_path: str,
+        context: Dict[str, Any]
+) -> str:
+    """Render template_path to the executable script output_path."""
+    pathlib.Path(os.path.dirname(output_path))\
+        .mkdir(parents=True, exist_ok=True)
+
+    template = env.get_template(template_path)
+    temporary = _temporary_path(output_path)
+    try:
+        with open(temporary, "w", buffering=_WRITE_BUFFER_SIZE) as file:
+            template.stream(context).dump(file)
+        # Same as mode "+x" of the Ansible file module
+        mode = os.stat(temporary).st_mode
+        os.chmod(temporary,
+                 mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        return _install(temporary, output_path)
+    finally:
+        if os.path.lexists(temporary):
+            os.remove(temporary)
+
+
+def _temporary_path(path: str) -> str:
+    return os.path.join(os.path.dirname(path), ".{}.{}.tmp".format(
+        os.path.basename(path), os.getpid()))
+
+
+def _install(temporary: str, path: str) -> str:
+    """
+    Move temporary to path and return its digest. path is left untouched
+    when it already has the same content and mode.
+    """
+    digest = yaml.file_digest(temporary)
+    # Both are rewritten within the timestamp granularity by later runs
+    yaml.forget_file(temporary)
+    try:
+        new, old = os.stat(temporary), os.stat(path)
+        if new.st_size == old.st_size and new.st_mode == old.st_mode \
+                and yaml.file_digest(path) == digest:
+            os.remove(temporary)
+            return digest
+    except FileNotFoundError:
+        pass
+    yaml.forget_file(path)
+    os.replace(temporary, path)
+    return digest
+
+
+_WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Line boundaries of str.splitlines()
+_LINE_BREAKS = "\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029"
+
+
+def _split_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """Lines of the text made of chunks, as str.splitlines() returns."""
+    rest = ""
+    for chunk in chunks:
+        if not chunk:
+            continue
+        lines = (rest + chunk).splitlines(keepends=True)
+        rest = lines.pop()
+        # An unterminated line, or "\r" which may start a "\r\n",
+        # continues in the next chunk
+        if rest[-1] in _LINE_BREAKS and rest[-1] != "\r":
+            lines.append(rest)
+            rest = ""
+        for line in lines:
+            yield line[:-2] if line.endswith("\r\n") else line[:-1]
+    if rest:
+        yield rest[:-1] if rest[-1] in _LINE_BREAKS else rest
+
+
+def _clean_lines(lines: Iterable[str]) -> Iterator[str]:
+    """Remove extra empty lines.
+
+    An empty line is only kept when followed by a non-empty line that
+    is not indented.
+    """
+    previous = None
+    for line in lines:
+        if previous is not None:
+            if len(previous.strip()) \
+                    or (len(line) and not line[0].isspace()):
+                yield previous
+        previous = line
+    if previous is not None and len(previous.strip()):
+        yield previous
+
+
+def _templates_digest(templates_path: str) -> str:
+    """Digest of all templates, as they may include each other."""
+    digest = hashlib.sha256(iac_init.__version__.encode())
+    for dir, _, files in sorted(os.walk(templates_path)):
+        for filename in sorted(files):
+            if ".j2" in filename:
+                path = os.path.join(dir, filename)
+                digest.update(os.path.relpath(path, templates_path).encode())
+                digest.update(yaml.file_digest(path).encode())
+    return digest.hexdigest()
+
+
+def _load_manifest(path: str) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    Files generated by the previous run, by path in the output dir. None
+    if there is no readable manifest.
+    """
+    try:
+        with open(path) as file:
+            manifest = json.load(file)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning("Cannot read working directory manifest: {}"
+                       .format(e))
+        return None
+    files = manifest.get("files", {})
+    if manifest.get("version") != iac_init.__version__:
+        # Files of another version are still removed once no longer
+        # generated, but never kept as they are
+        return {name: dict(record, key=None)
+                for name, record in files.items()}
+    return files
+
+
+def _save_manifest(path: str, files: Dict[str, Dict[str, Any]]) -> None:
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+                "w", dir=os.path.dirname(path), delete=False) as file:
+            json.dump({"version": iac_init.__version__, "files": files}, file)
+        os.replace(file.name, path)
+    except Exception as e:
+        logger.warning("Cannot write working directory manifest: {}"
+                       .format(e))
+
+
+def _is_current(path: str, record: Optional[Dict[str, Any]], key: str):
+    """Whether path was generated from key and is unchanged since."""
+    if not record or record["key"] != key:
+        return False
+    try:
+        return yaml.file_digest(path) == record["digest"]
+    except OSError:
+        return False
+
+
+# Environment and context of a render worker process
+_worker_env: Optional[Environment] = None
+_worker_context: Dict[str, Any] = {}
+
+
+def _init_render_worker(templates_path: str, context: Dict[str, Any]):
+    global _worker_env, _worker_context
+    _worker_env = _create_environment(templates_path)
+    _worker_context = context
+
+
+def _render_in_worker(
+        template_path: str, output_path: str
+) -> Tuple[str, float]:
+    start_time = time.monotonic()
+    digest = _render(
+        _worker_env, template_path, output_path, _worker_context)
+    return digest, time.monotonic() - start_time
+
+
 class YamlWriter:
     def __init__(
         self,
@@ -23,42 +289,114 @@ class YamlWriter:
         logger.info("Loading YAML files from {}".format(data_paths[0]))
         self.data = yaml.load_yaml_files(data_paths)
         self.filters: Dict[str, Any] = {}
+        self._context: Optional[Dict[str, Any]] = None
+        self._context_data: Any = None
+        self._context_digest = ""
+
+    @property
+    def context(self) -> Dict[str, Any]:
+        """Plain-dict copy of the data used as template context.
+
+        Built once per data object and shared by all templates, which must
+        not modify it.
+        """
+        if self._context is None or self._context_data is not self.data:
+            # json roundtrip should be safe
+            # as everything should be serializable
+            data = json.dumps(self.data)
+            self._context = json.loads(data)
+            self._context_data = self.data
+            self._context_digest = hashlib.sha256(data.encode()).hexdigest()
+        return self._context
 
-    def render_template(
+    @property
+    def context_digest(self) -> str:
+        """SHA-256 of the template context."""
+        self.context  # (re)builds the digest along with the context
+        return self._context_digest
+
+    def render_templates(
             self,
-            template_path: str,
-            output_path: str,
-            env: Environment,
-            **kwargs: Any
-    ) -> None:
-        """Render single robot jinja template"""
-        logger.info("Render Ansible playbook template: {}"
-                    .format(template_path))
-        # create output directory if it does not exist yet
-        pathlib.Path(os.path.dirname(output_path))\
-            .mkdir(parents=True, exist_ok=True)
-
-        template = env.get_template(template_path)
-        # json roundtrip should be safe
-        # as everything should be serializable
-        data = json.loads(json.dumps(self.data))
-        result = template.render(data, **kwargs)
-
-        # remove extra empty lines
-        lines = result.splitlines()
-        cleaned_lines = []
-        for index, line in enumerate(lines):
-            if len(line.strip()):
-                cleaned_lines.append(line)
-            else:
-                if index + 1 < len(lines):
-                    next_line = lines[index + 1]
-                    if len(next_line) and not next_line[0].isspace():
-                        cleaned_lines.append(line)
-        result = os.linesep.join(cleaned_lines)
+            templates_path: str,
+            renders: List[Tuple[str, str]],
+            env: Environment
+    ) -> List[Dict[str, Any]]:
+        """
+        Render (template path, output path) pairs concurrently.
+
+        Threads share env. With RENDER_POOL "process", each worker process
+        compiles its own environment, which pays off for large data sets
+        as rendering is CPU bound. Returns the run_in_pool result dicts,
+        in input order, with the digest of each written file as result.
+        """
+        context = self.context
+        workers = max(1, min(settings.RENDER_WORKERS, len(renders)))
+        if settings.RENDER_POOL != "process" or workers == 1:
+            return run_in_pool(
+                lambda t_path, o_path: _render(env, t_path, o_path, context),
+                renders,
+                workers
+            )
 
-        with open(output_path.replace('.j2', ''), "w") as file:
-            file.write(result)
+        results = []
+        with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_render_worker,
+                initargs=(templates_path, context)
+        ) as executor:
+            futures = [
+                executor.submit(_render_in_worker, t_path, o_path)
+                for t_path, o_path in renders
+            ]
+            for future in futures:
+                try:
+                    digest, elapsed = future.result()
+                    results.append({
+                        "result": digest,
+                        "elapsed": elapsed,
+                        "error": None,
+                    })
+                except Exception as e:
+                    results.append(
+                        {"result": False, "elapsed": 0, "error": str(e)})
+        return results
+
+    def device_scripts(self, step: str) -> List[Tuple[str, str, Any]]:
+        """
+        (template, script, device) of every per-device script of step,
+        relative to its templates and output dirs, see DEVICE_SCRIPTS.
+        """
+        fabric = self.context.get("fabric") or {}
+        image = str((fabric.get("global_policies") or {})
+                    .get("apic_image", ""))
+        # Same as "echo <apic_image> | awk -F '.' '{print $2}'"
+        fields = image.split(".")
+        major = fields[1] if len(fields) > 1 else ""
+
+        scripts = []
+        for template, devices, script in settings.DEVICE_SCRIPTS.get(
+                step, []):
+            for device in fabric.get(devices) or []:
+                scripts.append((
+                    template.format(major=major),
+                    script.format(hostname=device["hostname"]),
+                    device
+                ))
+        return scripts
+
+    def track(self, output_path: str, path: str) -> None:
+        """
+        Record path, written into the working directory of output_path
+        after write(), in the manifest of its step. It is then removed by
+        a later write() unless written again.
+        """
+        name = os.path.relpath(path, output_path)
+        step = name.split(os.sep)[0]
+        manifest_path = os.path.join(
+            output_path, ".manifest", "{}.json".format(step))
+        manifest = _load_manifest(manifest_path) or {}
+        manifest[name] = {"key": None, "digest": yaml.file_digest(path)}
+        _save_manifest(manifest_path, manifest)
 
     def _fix_duplicate_path(self, *paths: str) -> str:
         directory = os.path.join(*paths[:-1])
@@ -71,17 +409,40 @@ class YamlWriter:
         return os.path.join(*paths)
 
     def write(self, templates_path: str, output_path: str) -> None:
-        env = Environment(
-            loader=FileSystemLoader(templates_path),
-            undefined=ChainableUndefined,
-            lstrip_blocks=True,
-            trim_blocks=True,
-        )
+        """
+        Generate the working directory of templates_path in output_path.
+
+        Generation is incremental: files still generated from the same
+        templates, data and static files as recorded in the manifest of
+        the previous run are kept, and files no longer generated are
+        removed. Other files are rendered again but only rewritten when
+        their content changes.
+        """
+        env = _create_environment(templates_path)
+        step = os.path.basename(templates_path)
+        manifest_path = os.path.join(
+            output_path, ".manifest", "{}.json".format(step))
+        step_path = os.path.join(output_path, step)
+        previous = _load_manifest(manifest_path)
+        if previous is None:
+            previous = {}
+            # Nothing tells which files an earlier run, e.g. one before
+            # manifests, left there: start over
+            if os.path.isdir(step_path):
+                shutil.rmtree(step_path)
+                logger.info("Removed working directory without manifest: {}"
+                            .format(step_path))
+        manifest: Dict[str, Dict[str, Any]] = {}
+        render_key = hashlib.sha256("{}:{}".format(
+            _templates_digest(templates_path), self.context_digest
+        ).encode()).hexdigest()
 
+        renders = []
+        placed: Counter = Counter()
         for dir, _, files in os.walk(templates_path):
             if files:
-                try:
-                    for filename in files:
+                for filename in files:
+                    try:
                         if (
                                 ".j2" not in filename
                         ):
@@ -92,14 +453,25 @@ class YamlWriter:
                             )
                             out = os.path.join(
                                 output_path,
-                                os.path.basename(templates_path),
+                                step,
                                 os.path.relpath(dir, templates_path)
                             )
+                            self.o_path = os.path.join(out, filename)
+                            name = os.path.relpath(self.o_path, output_path)
+                            key = yaml.file_digest(os.path.join(dir, filename))
+                            record = previous.get(name)
+                            if _is_current(self.o_path, record, key):
+                                manifest[name] = record
+                                continue
                             pathlib.Path(out).mkdir(
                                 parents=True,
                                 exist_ok=True
                             )
-                            shutil.copy(os.path.join(dir, filename), out)
+                            method = copy_file(
+                                os.path.join(dir, filename), self.o_path)
+                            placed[method] += 1
+                            manifest[name] = {
+                                "key": key, "digest": key, "method": method}
                             continue
 
                         rel = os.path.relpath(dir, templates_path)
@@ -107,25 +479,35 @@ class YamlWriter:
                         t_path = t_path.replace("\\", "/")
                         o_dir = self._fix_duplicate_path(
                             output_path,
-                            os.path.basename(templates_path),
+                            step,
                             rel
                         )
 
                         self.o_path = os.path.join(o_dir, filename)
-                        self.render_template(t_path, self.o_path, env)
-                        logger.info("Generate working file successfully: {}"
-                                    .format(self.o_path))
-                except Exception as e:
-                    logger.error("Generate working file failed: {}"
-                                 .format(self.o_path))
-                    logger.error("Error: {}".format(e))
-                    exit()
+                        name = os.path.relpath(
+                            self.o_path.replace('.j2', ''), output_path)
+                        record = previous.get(name)
+                        if _is_current(
+                                self.o_path.replace('.j2', ''),
+                                record,
+                                render_key
+                        ):
+                            logger.info("Working file unchanged: {}"
+                                        .format(self.o_path))
+                            manifest[name] = record
+                            continue
+                        renders.append((t_path, self.o_path))
+                    except Exception as e:
+                        logger.error("Generate working file failed: {}"
+                                     .format(self.o_path))
+                        logger.error("Error: {}".format(e))
+                        exit()
             else:
                 try:
                     rel = os.path.relpath(dir, templates_path)
                     rel = rel.replace("\\", "/")
                     self.o_dir = self._fix_duplicate_path(
-                        output_path, os.path.basename(templates_path), rel
+                        output_path, step, rel
                     )
                     pathlib.Path(self.o_dir).mkdir(parents=True, exist_ok=True)
                     logger.info("Generate working directory successfully: {}"
@@ -135,3 +517,76 @@ class YamlWriter:
                                  .format(self.o_dir))
                     logger.error("Error: {}".format(e))
                     exit()
+
+        if placed:
+            logger.info("Placed static files: {}".format(", ".join(
+                "{} {}".format(count, method)
+                for method, count in sorted(placed.items()))))
+
+        # Templates render concurrently, results are logged in walk order
+        results = self.render_templates(templates_path, renders, env)
+        for (t_path, o_path), result in zip(renders, results):
+            logger.info("Render Ansible playbook template: {}"
+                        .format(t_path))
+            if result["error"] is not None:
+                logger.error("Generate working file failed: {}"
+                             .format(o_path))
+                logger.error("Error: {}".format(result["error"]))
+                exit()
+            logger.info("Generate working file successfully: {} ({:.2f}s)"
+                        .format(o_path, result["elapsed"]))
+            name = os.path.relpath(o_path.replace('.j2', ''), output_path)
+            manifest[name] = {"key": render_key, "digest": result["result"]}
+
+        # Per-device scripts render in a single in-process pass, the
+        # playbooks only execute them
+        try:
+            scripts = self.device_scripts(step)
+        except Exception as e:
+            logger.error("Generate device scripts failed: {}".format(e))
+            exit()
+        script_env = _create_script_environment(templates_path)
+        template_digests: Dict[str, str] = {}
+        for t_path, o_path, device in scripts:
+            o_path = os.path.join(output_path, step, o_path)
+            try:
+                if t_path not in template_digests:
+                    template_digests[t_path] = yaml.file_digest(
+                        os.path.join(templates_path, t_path))
+                key = hashlib.sha256("{}:{}".format(
+                    render_key, template_digests[t_path]
+                ).encode()).hexdigest()
+                name = os.path.relpath(o_path, output_path)
+                record = previous.get(name)
+                if _is_current(o_path, record, key):
+                    logger.info("Working file unchanged: {}".format(o_path))
+                    manifest[name] = record
+                    continue
+                logger.info("Render device script template: {}"
+                            .format(t_path))
+                digest = _render_script(
+                    script_env, t_path, o_path,
+                    dict(self.context, item=device))
+                logger.info("Generate working file successfully: {}"
+                            .format(o_path))
+                manifest[name] = {"key": key, "digest": digest}
+            except Exception as e:
+                logger.error("Generate working file failed: {}"
+                             .format(o_path))
+                logger.error("Error: {}".format(e))
+                exit()
+
+        step_root = os.path.realpath(step_path)
+        for name in previous:
+            path = os.path.join(output_path, name)
+            if name in manifest or not os.path.isfile(path):
+                continue
+            # Never follow the manifest out of the step working directory
+            if os.path.commonpath([step_root, os.path.realpath(path)]) \
+                    != step_root:
+                logger.warning("Not removing {}, outside of {}"
+                               .format(path, step_path))
+                continue
+            os.remove(path)
+            logger.info("Removed stale working file: {}".format(path))
+        _save_manifest(manifest_path, manifest)
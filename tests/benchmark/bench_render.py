@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Wang Xiao <xiawang3@cisco.com>
+
+"""
+Render time per template as the data set grows.
+
+Compares YamlWriter, which builds the template context once, with the
+previous behaviour of a json roundtrip of the whole data per template.
+
+    python tests/benchmark/bench_render.py [--templates N] [--sizes ...]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from iac_init.conf import settings
+from iac_init.yaml_conf.yaml_writer import YamlWriter
+
+TEMPLATE = """\
+{% for tenant in apic.tenants %}
+- tenant: {{ tenant.name }}
+  epgs: {{ tenant.application_profiles[0].endpoint_groups | length }}
+{% endfor %}
+"""
+
+
+class PerTemplateContextWriter(YamlWriter):
+    """YamlWriter converting the data again for every template."""
+
+    @property
+    def context(self):
+        return json.loads(json.dumps(self.data))
+
+
+def make_data(epgs: int) -> dict:
+    tenants = max(1, epgs // 100)
+    return {"apic": {"tenants": [
+        {
+            "name": "tenant{}".format(t),
+            "vrfs": [{"name": "vrf{}".format(t)}],
+            "bridge_domains": [
+                {"name": "bd{}".format(i), "vrf": "vrf{}".format(t)}
+                for i in range(epgs // tenants)
+            ],
+            "application_profiles": [{
+                "name": "ap{}".format(t),
+                "endpoint_groups": [
+                    {
+                        "name": "epg{}".format(i),
+                        "bridge_domain": "bd{}".format(i),
+                        "physical_domains": ["phys"],
+                        "static_ports": [
+                            {"node_id": 101 + p, "port": p + 1, "vlan": i}
+                            for p in range(4)
+                        ],
+                    }
+                    for i in range(epgs // tenants)
+                ],
+            }],
+        }
+        for t in range(tenants)
+    ]}}
+
+
+def bench(writer_class, data_dir, templates_dir, output_dir, templates):
+    writer = writer_class([data_dir])
+    start = time.perf_counter()
+    writer.write(templates_dir, output_dir)
+    return (time.perf_counter() - start) / templates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--templates", type=int, default=20)
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[100, 1000, 5000, 20000])
+    args = parser.parse_args()
+    settings.YAML_DISK_CACHE = False
+
+    print("{:>8} {:>16} {:>16} {:>8}".format(
+        "EPGs", "per-template ms", "shared ms", "speedup"))
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            data_dir = os.path.join(tmp, "data")
+            templates_dir = os.path.join(tmp, "templates")
+            os.makedirs(data_dir)
+            os.makedirs(templates_dir)
+            # JSON is valid YAML and much faster to produce
+            with open(os.path.join(data_dir, "data.yaml"), "w") as file:
+                json.dump(make_data(size), file)
+            for i in range(args.templates):
+                path = os.path.join(templates_dir, "t{}.yaml.j2".format(i))
+                with open(path, "w") as file:
+                    file.write(TEMPLATE)
+
+            old = bench(PerTemplateContextWriter, data_dir, templates_dir,
+                        os.path.join(tmp, "old"), args.templates)
+            new = bench(YamlWriter, data_dir, templates_dir,
+                        os.path.join(tmp, "new"), args.templates)
+        print("{:>8} {:>16.2f} {:>16.2f} {:>7.1f}x".format(
+            size, old * 1000, new * 1000, old / new))
+
+
+if __name__ == "__main__":
+    main()
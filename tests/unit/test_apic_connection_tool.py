@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Wang Xiao <xiawang3@cisco.com>
+
+from types import SimpleNamespace
+
+import pytest
+
+from iac_init.scripts import apic_connecton_tool
+
+pytestmark = pytest.mark.unit
+
+
+def response(status_code, body=None):
+    return SimpleNamespace(status_code=status_code, json=lambda: body)
+
+
+def token_response(method, token):
+    return response(200, {"imdata": [{method: {"attributes": {
+        "token": token, "refreshTimeoutSeconds": "600"}}}]})
+
+
+class FakeSession:
+    """requests.Session stand-in answering requests with responses."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+        self.headers = {}
+
+    def request(self, method, url, **kwargs):
+        self.requests.append((method, url.rsplit("/", 1)[-1]))
+        return self.responses.pop(0)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
+def new_client(*responses):
+    client = apic_connecton_tool.ApicClient("10.0.0.1", "admin", "password")
+    client.session = FakeSession(*responses)
+    return client
+
+
+def expire_token(client):
+    client.token_time -= client.refresh_timeout
+
+
+def test_expired_token_is_refreshed():
+    client = new_client(
+        token_response("aaaLogin", "first"),
+        token_response("aaaRefresh", "second"),
+        response(200, {"imdata": []}),
+    )
+    client.login()
+    expire_token(client)
+
+    assert client.get("/node/class/fvTenant.json") == {"imdata": []}
+    assert client.token == "second"
+    assert client.session.requests == [
+        ("POST", "aaaLogin.json"), ("GET", "aaaRefresh.json"),
+        ("GET", "fvTenant.json")]
+
+
+def test_failed_refresh_logs_in_again():
+    client = new_client(
+        token_response("aaaLogin", "first"),
+        response(403),
+        token_response("aaaLogin", "second"),
+        response(200, {"imdata": []}),
+    )
+    client.login()
+    expire_token(client)
+
+    assert client.get("/node/class/fvTenant.json") == {"imdata": []}
+    assert client.token == "second"
+    assert client.session.headers["Cookie"] == "APIC-cookie=second"
+    assert client.session.requests == [
+        ("POST", "aaaLogin.json"), ("GET", "aaaRefresh.json"),
+        ("POST", "aaaLogin.json"), ("GET", "fvTenant.json")]
+
+
+def test_rejected_token_logs_in_once():
+    client = new_client(
+        token_response("aaaLogin", "first"),
+        response(401),
+        token_response("aaaLogin", "second"),
+        response(401),
+    )
+    client.login()
+
+    with pytest.raises(apic_connecton_tool.ApicApiError) as e:
+        client.get("/node/class/fvTenant.json")
+    assert e.value.status == 401
+    assert client.session.requests == [
+        ("POST", "aaaLogin.json"), ("GET", "fvTenant.json"),
+        ("POST", "aaaLogin.json"), ("GET", "fvTenant.json")]
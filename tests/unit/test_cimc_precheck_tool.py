@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Wang Xiao <xiawang3@cisco.com>
+
+import gzip
+import io
+import threading
+import xml.etree.ElementTree as ET
+from types import SimpleNamespace
+from xml.sax.saxutils import quoteattr
+
+import pytest
+
+from iac_init.conf import settings
+from iac_init.scripts import cimc_precheck_tool
+from iac_init.utils.exceptions import CimcApiError
+
+pytestmark = pytest.mark.unit
+
+LOGIN = '<aaaLogin response="yes" outCookie="{}" outRefreshPeriod="600"/>'
+
+
+class FakeSession:
+    """
+    requests.Session stand-in: answer(request) returns the XML body
+    answering a request, all requests are kept in requests.
+    """
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def post(self, url, data, timeout, stream=False):
+        with self.lock:
+            self.requests.append(data)
+        body = self.answer(data).encode()
+        return SimpleNamespace(status_code=200, content=body,
+                               raw=io.BytesIO(body), close=lambda: None)
+
+    def close(self):
+        pass
+
+
+def new_client(answer, username="admin", password="password"):
+    client = cimc_precheck_tool.CimcClient(
+        "10.0.0.1", username, password)
+    client.session = FakeSession(answer)
+    return client
+
+
+def tags(client):
+    return [ET.fromstring(request).tag for request in client.session.requests]
+
+
+def logins(answer):
+    """answer, with numbered cookies for aaaLogin and aaaRefresh."""
+    cookies = iter(range(1, 100))
+
+    def wrapped(request):
+        root = ET.fromstring(request)
+        if root.tag in ("aaaLogin", "aaaRefresh"):
+            return LOGIN.format("cookie{}".format(next(cookies))) \
+                .replace("aaaLogin", root.tag)
+        return answer(root)
+
+    return wrapped
+
+
+def test_login_escapes_credentials():
+    client = new_client(logins(None), 'ad"min', "<pass'word>")
+    client.login()
+
+    request = ET.fromstring(client.session.requests[0])
+    assert request.get("inName") == 'ad"min'
+    assert request.get("inPassword") == "<pass'word>"
+    assert client.cookie == "cookie1"
+    assert client.refresh_period == 600
+
+
+def test_expired_cookie_is_refreshed():
+    client = new_client(logins(lambda root: '<configConfMo/>'))
+    client.login()
+    client.cookie_time -= client.refresh_period
+
+    client.conf_mo('<computeRackUnit dn="sys/rack-unit-1"/>')
+
+    assert tags(client) == ["aaaLogin", "aaaRefresh", "configConfMo"]
+    assert ET.fromstring(client.session.requests[-1]).get("cookie") == \
+        "cookie2"
+
+
+def test_rejected_cookie_logs_in_once():
+    client = new_client(logins(lambda root: (
+        '<configResolveClass errorCode="552" errorDescr="expired"/>'
+        if root.get("cookie") == "cookie1" else '<configResolveClass/>')))
+
+    client.resolve_class("faultInst")
+
+    assert tags(client) == ["aaaLogin", "configResolveClass", "aaaLogin",
+                            "configResolveClass"]
+
+
+def test_other_errors_are_not_retried():
+    client = new_client(logins(lambda root: (
+        '<configConfMo errorCode="103" errorDescr="bad config"/>')))
+
+    with pytest.raises(CimcApiError) as e:
+        client.conf_mo('<computeRackUnit dn="sys/rack-unit-1"/>')
+    assert e.value.code == "103"
+    assert tags(client) == ["aaaLogin", "configConfMo"]
+
+
+def test_conf_mo_sends_config():
+    client = new_client(logins(lambda root: '<configConfMo/>'))
+    config = '<computeRackUnit dn="sys/rack-unit-1" adminPower="down"/>'
+
+    client.conf_mo(config)
+
+    request = ET.fromstring(client.session.requests[-1])
+    assert request.get("cookie") == "cookie1"
+    assert ET.tostring(request.find("inConfig/computeRackUnit")) == \
+        ET.tostring(ET.fromstring(config))
+
+
+def test_resolve_many():
+    def answer(root):
+        value = root.get("classId") or root.get("dn")
+        return '<{0}><outConfigs><found name={1}/></outConfigs></{0}>' \
+            .format(root.tag, quoteattr(value))
+
+    client = new_client(logins(answer))
+
+    response = client.resolve_many({
+        "mapping": ("class", "commVMediaMap"),
+        "firmware": ("dn", 'sys/rack-unit-1/"fw"'),
+    })
+
+    assert response["mapping"].find(".//found").get("name") == \
+        "commVMediaMap"
+    assert response["firmware"].tag == "configResolveDn"
+    assert response["firmware"].find(".//found").get("name") == \
+        'sys/rack-unit-1/"fw"'
+    assert tags(client).count("aaaLogin") == 1
+
+
+FAULTS = (
+    '<configResolveClass cookie="cookie1" classId="faultInst">'
+    '<outConfigs>'
+    '<faultInst severity="critical" code="F0181" descr="Disk failed"/>'
+    '<faultInst severity="major" code="F0531" descr="PSU lost"/>'
+    '<faultInst severity="major" code="F0531" descr="PSU lost"/>'
+    '<faultInst severity="minor" code="F0997" descr="Fan slow"/>'
+    '</outConfigs>'
+    '</configResolveClass>'
+)
+
+
+def test_iter_class_yields_every_fault():
+    client = new_client(logins(lambda root: FAULTS))
+
+    faults = [dict(fault.attrib) for fault in client.iter_class("faultInst")]
+
+    assert faults == [dict(fault.attrib) for fault in
+                      ET.fromstring(FAULTS).iter("faultInst")]
+
+
+def test_fault_summary(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CIMC_FAULT_ARTIFACT", True)
+    monkeypatch.setattr(settings, "OUTPUT_BASE_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "CIMC_FAULT_FAIL_SEVERITIES", [])
+    (tmp_path / "iac_init_log").mkdir()
+    client = new_client(logins(lambda root: FAULTS))
+    report = {}
+
+    assert cimc_precheck_tool.cimc_fault_summary(client, report)
+
+    assert report == {"faults": 4, "fault_severity": {
+        "critical": 1, "major": 2, "minor": 1}}
+    artifact = tmp_path / "iac_init_log" / "cimc_faults_10.0.0.1.xml.gz"
+    with gzip.open(artifact, "rt") as file:
+        assert file.read() == FAULTS
+
+
+@pytest.mark.parametrize("severities, passed", [
+    (["critical"], False),
+    (["warning", "major"], False),
+    (["warning"], True),
+])
+def test_fault_summary_fail_severities(monkeypatch, severities, passed):
+    monkeypatch.setattr(settings, "CIMC_FAULT_ARTIFACT", False)
+    monkeypatch.setattr(settings, "CIMC_FAULT_FAIL_SEVERITIES", severities)
+    client = new_client(logins(lambda root: FAULTS))
+
+    assert cimc_precheck_tool.cimc_fault_summary(client) is passed
+
+
+def test_fault_summary_by_code(monkeypatch):
+    monkeypatch.setattr(settings, "CIMC_FAULT_ARTIFACT", False)
+    client = new_client(logins(lambda root: FAULTS))
+    messages = []
+    handler = cimc_precheck_tool.logger.add(
+        messages.append, format="{message}")
+    try:
+        cimc_precheck_tool.cimc_fault_summary(client)
+    finally:
+        cimc_precheck_tool.logger.remove(handler)
+
+    assert "  F0531 [major] x2: PSU lost\n" in messages
+    assert "  F0181 [critical] x1: Disk failed\n" in messages
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Wang Xiao <xiawang3@cisco.com>
+
+import errno
+import os
+
+import pytest
+
+from iac_init.scripts import copy_tool
+
+pytestmark = pytest.mark.unit
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "source"
+    path.write_text("payload")
+    path.chmod(0o640)
+    return path
+
+
+def test_copy_file_links_within_filesystem(tmp_path, source):
+    destination = tmp_path / "destination"
+    method = copy_tool.copy_file(
+        str(source), str(destination), ["reflink", "hardlink", "copy"])
+    assert method in ("reflink", "hardlink")
+    assert destination.read_text() == "payload"
+    assert destination.stat().st_mode & 0o777 == 0o640
+    if method == "hardlink":
+        assert os.path.samefile(source, destination)
+
+
+def test_copy_file_copy_only(tmp_path, source):
+    destination = tmp_path / "destination"
+    assert copy_tool.copy_file(str(source), str(destination), ["copy"]) \
+        == "copy"
+    assert destination.read_text() == "payload"
+    assert not os.path.samefile(source, destination)
+    assert destination.stat().st_mode & 0o777 == 0o640
+
+
+def test_copy_file_replaces_hardlink(tmp_path, source):
+    destination = tmp_path / "destination"
+    os.link(source, destination)
+    other = tmp_path / "other"
+    other.write_text("other")
+
+    copy_tool.copy_file(str(other), str(destination), ["copy"])
+
+    assert destination.read_text() == "other"
+    assert source.read_text() == "payload"
+    assert sorted(os.listdir(tmp_path)) == ["destination", "other", "source"]
+
+
+def test_copy_file_falls_back_to_copy(tmp_path, source, monkeypatch):
+    def fail(*args):
+        raise OSError(errno.EOPNOTSUPP, "not supported")
+
+    monkeypatch.setattr(copy_tool, "_reflink", fail)
+    monkeypatch.setattr(copy_tool.os, "link", fail)
+    monkeypatch.setattr(copy_tool, "_unsupported", set())
+    destination = tmp_path / "destination"
+
+    assert copy_tool.copy_file(
+        str(source), str(destination), ["reflink", "hardlink"]) == "copy"
+    assert destination.read_text() == "payload"
+    assert sorted(os.listdir(tmp_path)) == ["destination", "source"]
+
+
+def test_copy_file_default_never_hardlinks(tmp_path, source):
+    destination = tmp_path / "destination"
+    assert copy_tool.copy_file(str(source), str(destination)) != "hardlink"
+    assert not os.path.samefile(source, destination)
+
+
+def test_copy_file_retries_after_file_error(tmp_path, source, monkeypatch):
+    def fail(*args):
+        raise OSError(errno.EACCES, "permission denied")
+
+    monkeypatch.setattr(copy_tool.os, "link", fail)
+    monkeypatch.setattr(copy_tool, "_unsupported", set())
+
+    assert copy_tool.copy_file(
+        str(source), str(tmp_path / "destination"), ["hardlink"]) == "copy"
+    assert not copy_tool._unsupported
+
+
+def test_copy_file_unknown_method(tmp_path, source):
+    with pytest.raises(ValueError):
+        copy_tool.copy_file(str(source), str(tmp_path / "d"), ["symlink"])
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Wang Xiao <xiawang3@cisco.com>
+
+import os
+
+import pytest
+
+from iac_init.validator import Validator
+from iac_init.yaml_conf import data_index
+
+pytestmark = pytest.mark.unit
+
+
+@pytest.fixture(autouse=True)
+def clear_indexes():
+    yield
+    data_index.clear_data_indexes()
+
+
+def make_tree(root):
+    """Data dir with fabric.yml at several depths, returns the root."""
+    for relpath in ("fabric.yml", "nodes/fabric.yml", "nodes/leaf.yml",
+                    "nodes/spine/fabric.yml", "tenants/fabric.yml",
+                    "tenants/a.yml"):
+        path = root / relpath
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("{}: {}\n".format(relpath, len(relpath)))
+    os.symlink(root / "nodes", root / "link")
+    return root
+
+
+def walked(root):
+    return [os.path.join(dir, name)
+            for dir, _, files in os.walk(root) for name in files]
+
+
+def test_find_returns_last_in_walk_order(tmp_path):
+    index = data_index.DataIndex(str(make_tree(tmp_path)))
+
+    assert index.find("fabric.yml").path == \
+        [path for path in walked(tmp_path)
+         if os.path.basename(path) == "fabric.yml"][-1]
+    assert index.find("missing.yml") is None
+
+
+def test_walk(tmp_path):
+    index = data_index.DataIndex(str(make_tree(tmp_path)))
+
+    assert [f.path for f in index.walk(str(tmp_path))] == walked(tmp_path)
+    assert [f.path for f in index.walk(str(tmp_path / "nodes"))] == \
+        walked(tmp_path / "nodes")
+    assert index.walk(str(tmp_path / "link")) is None
+    assert index.walk(str(tmp_path.parent)) is None
+
+
+def test_walk_scans_unindexed_dir(tmp_path):
+    make_tree(tmp_path)
+    data_index.scan_data_dir(str(tmp_path / "nodes"))
+
+    assert [f.path for f in data_index.walk(str(tmp_path / "tenants"))] == \
+        walked(tmp_path / "tenants")
+    assert data_index.walk(str(tmp_path / "fabric.yml")) is None
+
+
+def test_validator_drops_earlier_indexes(tmp_path):
+    make_tree(tmp_path)
+    data_index.scan_data_dir(str(tmp_path))
+    leaf = tmp_path / "nodes" / "leaf.yml"
+    leaf.write_text("changed: true\n")
+
+    index = Validator(str(tmp_path / "nodes"), "")._get_data_index()
+
+    assert data_index.lookup(str(leaf)) is index
+    assert data_index.get_file(str(leaf)).size == leaf.stat().st_size
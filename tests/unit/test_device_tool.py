@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Wang Xiao <xiawang3@cisco.com>
+
+import contextlib
+import io
+import json
+import os
+import shutil
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from iac_init.conf import settings
+from iac_init.scripts import device_tool
+
+pytestmark = pytest.mark.unit
+
+# Shell scripts standing in for expect scripts, run with EXPECT_PATH sh
+SCRIPTS = os.path.join(os.path.dirname(__file__), "fixtures", "scripts")
+
+
+def script(name):
+    return os.path.join(SCRIPTS, name)
+
+
+def copy_script(name, working_dir, script_name):
+    shutil.copy(script(name), os.path.join(working_dir, script_name))
+
+
+def read_summary(log_prefix):
+    with open("{}.json".format(log_prefix)) as file:
+        return json.load(file)
+
+
+def fake_cimc_client(calls, failing=()):
+    """CimcClient stand-in appending (ip, timeout, config) to calls."""
+
+    @contextlib.contextmanager
+    def client(ip, username, password, timeout):
+        if ip in failing:
+            raise ConnectionError("unreachable")
+        yield SimpleNamespace(
+            conf_mo=lambda config: calls.append((ip, timeout, config)))
+
+    return client
+
+
+def test_pipelines_run_stages_in_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "EXPECT_PATH", "/bin/sh")
+    log_prefix = str(tmp_path / "log" / "reimage")
+
+    assert device_tool.run_device_pipelines({
+        "leaf101": [
+            ("reimage", device_tool.expect_stage(script("first.exp"))),
+            ("post_check", device_tool.expect_stage(script("second.exp"))),
+        ],
+    }, 4, log_prefix)
+
+    log = (tmp_path / "log" / "reimage_leaf101.log").read_text()
+    assert log.index("first\n") < log.index("second\n")
+    assert read_summary(log_prefix)["leaf101"]["exit_codes"] == \
+        {"reimage": 0, "post_check": 0}
+
+
+def test_pipelines_stop_at_failure(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "EXPECT_PATH", "/bin/sh")
+    passing = device_tool.expect_stage(script("passing.exp"))
+    log_prefix = str(tmp_path / "reimage")
+
+    assert not device_tool.run_device_pipelines({
+        "leaf101": [("reimage", passing)],
+        "leaf102": [
+            ("reimage", device_tool.expect_stage(script("failing.exp"))),
+            ("post_check", passing),
+        ],
+    }, 4, log_prefix)
+
+    summary = read_summary(log_prefix)
+    assert summary["leaf101"]["success"]
+    assert not summary["leaf102"]["success"]
+    assert summary["leaf102"]["exit_codes"] == {"reimage": 3}
+
+
+def test_pipelines_timeout(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "EXPECT_PATH", "/bin/sh")
+    log_prefix = str(tmp_path / "reimage")
+
+    assert not device_tool.run_device_pipelines({
+        "leaf101": [
+            ("reimage", device_tool.expect_stage(script("hanging.exp"), 0.2)),
+        ],
+    }, 1, log_prefix)
+
+    assert read_summary(log_prefix)["leaf101"]["exit_codes"] == \
+        {"reimage": device_tool.TIMEOUT_EXIT_CODE}
+
+
+def test_pipelines_run_devices_in_parallel(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "EXPECT_PATH", "/bin/sh")
+    pipelines = {
+        "leaf{}".format(i): [
+            ("reimage", device_tool.expect_stage(script("slow.exp"))),
+        ]
+        for i in range(4)
+    }
+
+    start_time = time.monotonic()
+    assert device_tool.run_device_pipelines(
+        pipelines, 4, str(tmp_path / "reimage"))
+    assert time.monotonic() - start_time < 1.0
+
+
+def test_pipelines_device_deadline(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "EXPECT_PATH", "/bin/sh")
+    slow = device_tool.expect_stage(script("slow.exp"))
+    log_prefix = str(tmp_path / "reimage")
+
+    assert not device_tool.run_device_pipelines({
+        "apic1": [("first", slow), ("second", slow)],
+    }, 1, log_prefix, timeout=0.5)
+
+    assert read_summary(log_prefix)["apic1"]["exit_codes"] == \
+        {"first": 0, "second": device_tool.TIMEOUT_EXIT_CODE}
+
+
+def test_reimage_switches(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "EXPECT_PATH", "/bin/sh")
+    monkeypatch.setattr(settings, "SWITCH_REIMAGE_MAX_WORKERS", 2)
+    for hostname in ("leaf101", "spine201"):
+        copy_script("passing.exp", tmp_path,
+                    "aci_switch_reimage_{}.exp".format(hostname))
+        copy_script("passing.exp", tmp_path,
+                    "aci_switch_reimage_post_check_{}.exp".format(hostname))
+    log_prefix = str(tmp_path / "log" / "wipe_switch")
+
+    assert device_tool.reimage_switches(
+        [{"hostname": "leaf101"}, {"hostname": "spine201"}],
+        str(tmp_path), log_prefix)
+    assert sorted(read_summary(log_prefix)) == ["leaf101", "spine201"]
+
+
+def test_reimage_apics(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "EXPECT_PATH", "/bin/sh")
+    monkeypatch.setattr(settings, "APIC_REIMAGE_MAX_WORKERS", 2)
+    calls = []
+    monkeypatch.setattr(device_tool, "CimcClient",
+                        fake_cimc_client(calls, failing={"10.0.0.12"}))
+    for hostname in ("apic1", "apic2"):
+        copy_script("passing.exp", tmp_path,
+                    "apic_reimage_{}.exp".format(hostname))
+        copy_script("passing.exp", tmp_path,
+                    "apic_reimage_post_check_{}.exp".format(hostname))
+    fabric = {
+        "global_policies": {
+            "apic_cimc_username": "admin",
+            "apic_cimc_password": "password",
+            "timezone": "UTC",
+            "ntp_server": "10.0.0.1",
+            "aci_image_path": "http://10.0.0.2/images/",
+            "apic_image": "aci-apic-dk9.6.0.5h.iso",
+        },
+        "apic_nodes_connection": [
+            {"hostname": "apic1", "description": "<apic 1>",
+             "cimc_address": "10.0.0.11"},
+            {"hostname": "apic2", "description": None,
+             "cimc_address": "10.0.0.12"},
+        ],
+    }
+    log_prefix = str(tmp_path / "log" / "wipe_apic")
+
+    assert not device_tool.reimage_apics(fabric, str(tmp_path), log_prefix)
+
+    summary = read_summary(log_prefix)
+    assert summary["apic1"]["exit_codes"] == {
+        "cimc_config": 0, "install": 0, "cimc_post_install": 0,
+        "post_check": 0}
+    assert summary["apic2"]["exit_codes"] == {"cimc_config": 1}
+    configs = [config for ip, timeout, config in calls]
+    assert '<computeRackUnit dn="sys/rack-unit-1" ' \
+        'usrLbl="&lt;apic 1&gt;"/>' in configs
+    assert configs[-4:] == device_tool.APIC_POST_INSTALL_CIMC_CONFIGS
+    assert "unreachable" in \
+        (tmp_path / "log" / "wipe_apic_apic2.log").read_text()
+
+
+def test_reimage_apics_missing_data(tmp_path):
+    assert not device_tool.reimage_apics(
+        {"global_policies": {}, "apic_nodes_connection": []},
+        str(tmp_path), str(tmp_path / "wipe_apic"))
+
+
+def test_cimc_stage_timeout(monkeypatch):
+    monkeypatch.setattr(settings, "CIMC_CONFIG_TIMEOUT", 500)
+    calls = []
+    monkeypatch.setattr(device_tool, "CimcClient", fake_cimc_client(calls))
+    stage = device_tool.cimc_stage(
+        "10.0.0.11", "admin", "password", ["<config/>"])
+
+    assert stage(io.BytesIO(), None) == 0
+    assert stage(io.BytesIO(), 30) == 0
+    assert [timeout for ip, timeout, config in calls] == [500, 30]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Wang Xiao <xiawang3@cisco.com>
+
+import socket
+
+import pytest
+
+from iac_init.scripts import tcp_scan_tool
+
+pytestmark = pytest.mark.unit
+
+
+def closed_port():
+    """A localhost port nothing listens on."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_scan_ports():
+    with socket.socket() as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        port = server.getsockname()[1]
+
+        results = tcp_scan_tool.scan_ports(
+            [("127.0.0.1", closed_port()), ("127.0.0.1", str(port))],
+            0.5, attempts=2)
+
+    assert [result["result"] for result in results] == [False, True]
+    assert results[0]["error"]
+    assert results[1]["error"] is None
+
+
+def test_scan_no_ports():
+    assert tcp_scan_tool.scan_ports([], 0.5) == []
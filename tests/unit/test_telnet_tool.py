@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Wang Xiao <xiawang3@cisco.com>
+
+import asyncio
+
+import pytest
+
+from iac_init.scripts import telnet_tool
+from iac_init.scripts.telnet_tool import IAC, DO, WILL, WONT, DONT, SB, SE
+
+pytestmark = pytest.mark.unit
+
+# Options offered by the stub server: DO echo, WILL suppress go ahead,
+# and a terminal type subnegotiation
+OPTIONS = bytes([IAC, DO, 1, IAC, WILL, 3, IAC, SB, 24, 1, IAC, SE])
+
+
+async def console(reader, writer, received, password, prompt):
+    """Stub console asking for login, answering with prompt."""
+    writer.write(OPTIONS + b"User Access Verification\r\n")
+    # The login prompt split from its options and from the banner
+    await writer.drain()
+    writer.write(b"login: ")
+    received.append(await reader.readuntil(b"\n"))
+    writer.write(b"Password: ")
+    received.append(await reader.readuntil(b"\n"))
+    if received[-1] == password + b"\n":
+        for chunk in prompt:
+            writer.write(chunk)
+            await writer.drain()
+            await asyncio.sleep(0.05)
+    else:
+        writer.write(b"\r\nLogin incorrect\r\n\r\nlogin: ")
+    await writer.drain()
+    received.append(await reader.read())
+    writer.close()
+
+
+def login(password, prompt, timeout=2):
+    """Log in to a stub console, returns (result, bytes received)."""
+    received = []
+
+    async def run():
+        server = await asyncio.start_server(
+            lambda r, w: console(r, w, received, b"secret", prompt),
+            "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            client = telnet_tool.AsyncTelnetClient("127.0.0.1", port, timeout)
+            result = await client.login_host("admin", password)
+            await asyncio.sleep(0.05)
+        return result
+
+    return asyncio.run(run()), received
+
+
+def test_login():
+    result, received = login("secret", [
+        b"\r\n##########\r\n", b"\x1b[01;32mleaf101# \x1b[0m\x1b[K"])
+
+    assert result
+    # Every option refused before the credentials
+    assert received[0] == bytes([IAC, WONT, 1, IAC, DONT, 3]) + b"admin\n"
+    assert received[1] == b"secret\n"
+    assert received[2] == b"exit\n"
+
+
+def test_login_banner_is_no_prompt():
+    result, _ = login("secret", [b"\r\nWelcome\r\n", b"#####"], timeout=0.5)
+
+    assert not result
+
+
+def test_login_incorrect():
+    result, received = login("wrong", [])
+
+    assert not result
+    assert received[1] == b"wrong\n"
+
+
+@pytest.mark.parametrize("output, prompt", [
+    (b"Last login: today\r\nleaf101# ", True),
+    (b"motd\r\n[admin@apic1 ~]$ ", True),
+    (b"apic1>", True),
+    (b"banner line\r\n#####", False),
+    (b"<b>\r\nleaf101# \r\nmore output", False),
+])
+def test_shell_prompt(output, prompt):
+    assert bool(telnet_tool.SHELL_PROMPT.search(output)) is prompt
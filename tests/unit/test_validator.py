@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Wang Xiao <xiawang3@cisco.com>
+
+import os
+import stat
+
+import pytest
+
+from iac_init import validator
+from iac_init.conf import settings
+
+pytestmark = pytest.mark.unit
+
+
+def ssh_ok(ip, username, password, timeout):
+    return True
+
+
+def telnet_error(*args):
+    raise RuntimeError("event loop failed")
+
+
+def new_validator(tmp_path):
+    v = validator.Validator(str(tmp_path), str(tmp_path))
+    v.cimc_address = ["10.0.0.1"]
+    v.switch_list = [("10.0.0.2", 2001), ("10.0.0.2", 2002)]
+    v.apic_cimc_credential = ("admin", "password")
+    v.aci_local_credential = ("admin", "password")
+    return v
+
+
+def test_telnet_error_fails_every_console(tmp_path, monkeypatch):
+    monkeypatch.setattr(validator, "check_ssh_connection", ssh_ok)
+    monkeypatch.setattr(validator, "login_hosts", telnet_error)
+    v = new_validator(tmp_path)
+
+    assert v.validate_ssh_telnet_connection()
+    assert "10.0.0.2:2001,10.0.0.2:2002" in v.errors[0]
+
+
+def test_missing_telnet_results_fail(tmp_path, monkeypatch):
+    monkeypatch.setattr(validator, "check_ssh_connection", ssh_ok)
+    monkeypatch.setattr(validator, "login_hosts", lambda *args: [
+        {"result": True, "elapsed": 0, "error": None}])
+    v = new_validator(tmp_path)
+
+    assert v.validate_ssh_telnet_connection()
+    assert "10.0.0.2:2002" in v.errors[0]
+    assert "10.0.0.2:2001" not in v.errors[0]
+
+
+def validate_data(data):
+    v = validator.Validator(str(data), str(data))
+    v._validate_yaml()
+    return v
+
+
+def test_validation_manifest(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(settings, "VALIDATION_MANIFEST", True)
+    monkeypatch.setattr(settings, "YAML_DISK_CACHE", False)
+    monkeypatch.setattr(settings, "global_policy", None, raising=False)
+    data = tmp_path / "data"
+    data.mkdir()
+    (data / settings.DEFAULT_DATA_PATH).write_text("fabric: {}\n")
+    (data / "broken.yml").write_text("a: [1\n")
+    validated = []
+    validate_file = validator.Validator._validate_syntax_file
+
+    def validate(self, file_path):
+        validated.append(os.path.basename(file_path))
+        return validate_file(self, file_path)
+
+    monkeypatch.setattr(validator.Validator, "_validate_syntax_file", validate)
+    monkeypatch.setattr(validator.Validator, "_load_connnection_info",
+                        lambda self: False)
+
+    first = validate_data(data)
+    # Same data dir, spelled differently
+    monkeypatch.chdir(tmp_path)
+    second = validate_data("./data/")
+    (data / "broken.yml").write_text("a: [1, 2]\n")
+    third = validate_data(data)
+
+    assert sorted(validated) == [settings.DEFAULT_DATA_PATH, "broken.yml",
+                                 "broken.yml"]
+    assert len(first.errors) == 1
+    assert second.errors == first.errors
+    assert third.errors == []
+    for directory, _, _ in os.walk(tmp_path / "cache"):
+        assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Wang Xiao <xiawang3@cisco.com>
+
+import pytest
+
+from iac_init.conf import settings
+from iac_init.scripts import vault_tool
+from iac_init.yaml_conf import yaml
+
+pytestmark = pytest.mark.unit
+
+VaultLib = pytest.importorskip("ansible.parsing.vault").VaultLib
+VaultSecret = pytest.importorskip("ansible.parsing.vault").VaultSecret
+
+PASSWORD = b"secret"
+
+
+def encrypt(plaintext):
+    vault = VaultLib([("default", VaultSecret(PASSWORD))])
+    return vault.encrypt(plaintext).decode()
+
+
+@pytest.fixture
+def vault_id(tmp_path, monkeypatch):
+    """Vault password file used as vault id, with an empty run cache."""
+    password_file = tmp_path / "password"
+    password_file.write_bytes(PASSWORD + b"\n")
+    monkeypatch.setattr(vault_tool, "get_vault_id", lambda: str(password_file))
+    monkeypatch.setattr(vault_tool, "_plaintexts", {})
+    monkeypatch.setattr(vault_tool, "_vault_lib", None)
+    return str(password_file)
+
+
+def test_decrypt_in_process(vault_id, monkeypatch):
+    ciphertexts = [encrypt("first"), encrypt("second")]
+    monkeypatch.setattr(vault_tool, "_decrypt_batch", None)
+
+    assert vault_tool.decrypt_vault(ciphertexts + ciphertexts[:1]) == {
+        ciphertexts[0]: "first", ciphertexts[1]: "second"}
+
+
+def test_load_vault_tag(vault_id, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "YAML_DISK_CACHE", False)
+    ciphertext = encrypt("password1")
+    data = tmp_path / "data.yml"
+    data.write_text("apic:\n  password: !vault |\n{}".format(
+        "".join("    " + line + "\n" for line in ciphertext.splitlines())))
+    yaml.clear_yaml_cache()
+
+    assert yaml.load_yaml_files([str(data)]) == \
+        {"apic": {"password": "password1"}}
+    assert list(vault_tool._plaintexts.values()) == ["password1"]
+
+
+@pytest.mark.parametrize("count", [1, 3])
+def test_decrypt_ansible_vault(vault_id, monkeypatch, count):
+    ciphertexts = [encrypt("value{}".format(i)) for i in range(count)]
+    monkeypatch.setattr(
+        vault_tool, "_decrypt_in_process", lambda ciphertexts, vault_id: None)
+
+    assert vault_tool.decrypt_vault(ciphertexts) == {
+        ciphertext: "value{}".format(i)
+        for i, ciphertext in enumerate(ciphertexts)}
+
+
+def test_broken_ciphertext_fails_alone(vault_id, monkeypatch):
+    ciphertexts = [encrypt("first"), "$ANSIBLE_VAULT;1.1;AES256\nbroken\n"]
+    monkeypatch.setattr(
+        vault_tool, "_decrypt_in_process", lambda ciphertexts, vault_id: None)
+
+    results = vault_tool.decrypt_vault(ciphertexts)
+
+    assert results[ciphertexts[0]] == "first"
+    assert isinstance(results[ciphertexts[1]], Exception)
+    # Only successes are kept for the run
+    assert list(vault_tool._plaintexts) == ciphertexts[:1]
+
+
+def test_decrypt_without_vault_id(monkeypatch):
+    monkeypatch.setattr(vault_tool, "get_vault_id", lambda: None)
+    monkeypatch.setattr(vault_tool, "_plaintexts", {})
+
+    assert vault_tool.decrypt_vault(["ciphertext"]) == {"ciphertext": ""}
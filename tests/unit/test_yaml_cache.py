@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Wang Xiao <xiawang3@cisco.com>
+
+import os
+import stat
+
+import pytest
+
+from iac_init.conf import settings
+from iac_init.scripts import cache_tool
+from iac_init.yaml_conf import yaml
+
+pytestmark = pytest.mark.unit
+
+VAULT_DOCUMENT = """\
+apic:
+  password: !vault |
+    $ANSIBLE_VAULT;1.1;AES256
+    6162
+  nodes: &nodes [1, 2]
+  copy: *nodes
+"""
+
+
+def use_cache_dir(monkeypatch, path):
+    monkeypatch.setattr(settings, "CACHE_DIR", str(path))
+    monkeypatch.setattr(settings, "YAML_DISK_CACHE", True)
+    monkeypatch.setattr(yaml, "_disk_cache_dirs", {})
+    yaml.clear_yaml_cache()
+
+
+def cache_files(path):
+    return [os.path.join(d, f) for d, _, files in os.walk(path)
+            for f in files]
+
+
+def test_document_cache_keeps_vault_tags(tmp_path, monkeypatch):
+    use_cache_dir(monkeypatch, tmp_path / "cache")
+    data = tmp_path / "data.yml"
+    data.write_text(VAULT_DOCUMENT)
+    yaml._load_document(str(data), "safe")
+    yaml.clear_yaml_cache()
+
+    document = yaml._load_document(str(data), "safe")
+
+    assert isinstance(document["apic"]["password"], yaml.VaultTag)
+    assert document["apic"]["password"].value.startswith("$ANSIBLE_VAULT")
+    assert document["apic"]["nodes"] is document["apic"]["copy"]
+    assert len(cache_files(tmp_path / "cache")) == 1
+
+
+def test_cache_dir_is_private(tmp_path, monkeypatch):
+    use_cache_dir(monkeypatch, tmp_path / "cache")
+    data = tmp_path / "data.yml"
+    data.write_text("a: 1\n")
+    yaml._load_document(str(data), "safe")
+
+    for directory, _, _ in os.walk(tmp_path / "cache"):
+        assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+
+
+def test_cache_file_of_other_user_is_ignored(tmp_path, monkeypatch):
+    use_cache_dir(monkeypatch, tmp_path / "cache")
+    data = tmp_path / "data.yml"
+    data.write_text("a: 1\n")
+    yaml._load_document(str(data), "safe")
+    yaml.clear_yaml_cache()
+    digest = os.path.basename(cache_files(tmp_path / "cache")[0])
+    kind, digest = digest.split("-", 1)
+    uid = os.getuid()
+    monkeypatch.setattr(cache_tool.os, "getuid", lambda: uid + 1)
+
+    assert yaml._read_disk_cache(kind, digest) is yaml._MISSING
+    assert yaml._load_document(str(data), "safe") == {"a": 1}
+
+
+def test_merged_cache_key_depends_on_order(tmp_path, monkeypatch):
+    use_cache_dir(monkeypatch, tmp_path / "cache")
+    first = tmp_path / "first.yml"
+    first.write_text("a: 1\n")
+    second = tmp_path / "second.yml"
+    second.write_text("a: 2\n")
+    paths = [str(first), str(second)]
+
+    key = yaml._merged_cache_key(paths, "safe")
+
+    assert key is not None
+    assert key != yaml._merged_cache_key(paths[::-1], "safe")
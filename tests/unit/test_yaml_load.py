@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Wang Xiao <xiawang3@cisco.com>
+
+import json
+import random
+
+import pytest
+
+from iac_init.conf import settings
+from iac_init.yaml_conf import yaml
+
+from .test_yaml_merge import random_document
+
+pytestmark = pytest.mark.unit
+
+
+def write_corpus(path, count, seed=0):
+    """Write count YAML files of random documents below path."""
+    rng = random.Random(seed)
+    for i in range(count):
+        directory = path / "dir{}".format(i % 7)
+        directory.mkdir(parents=True, exist_ok=True)
+        document = {"fabric": random_document(rng, 3)}
+        # JSON is valid YAML
+        (directory / "file{}.yml".format(i)).write_text(json.dumps(document))
+
+
+def load(path, processes):
+    yaml.clear_yaml_cache()
+    return yaml.load_yaml_files([str(path)], processes)
+
+
+def test_parallel_load_matches_sequential(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "YAML_DISK_CACHE", False)
+    monkeypatch.setattr(settings, "YAML_PARALLEL_LOAD_THRESHOLD", 1)
+    write_corpus(tmp_path / "data", 401)
+
+    sequential = load(tmp_path / "data", 1)
+
+    assert sequential["fabric"]
+    assert load(tmp_path / "data", 4) == sequential
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Wang Xiao <xiawang3@cisco.com>
+
+import copy
+import random
+
+import pytest
+
+from iac_init.yaml_conf import yaml
+
+pytestmark = pytest.mark.unit
+
+
+# Reference: the linear merge the indexed merge has to be equivalent to
+def reference_merge_list_item(source_item, destination, merge_list_items=True):
+    if isinstance(source_item, dict) and merge_list_items:
+        for dest_item in destination:
+            match = True
+            comparison = False
+            unique_source = False
+            unique_dest = False
+            for k, v in source_item.items():
+                if isinstance(v, dict) or isinstance(v, list):
+                    continue
+                if k in dest_item and v == dest_item[k]:
+                    comparison = True
+                    continue
+                if k not in dest_item:
+                    unique_source = True
+                    continue
+                comparison = True
+                match = False
+            for k, v in dest_item.items():
+                if isinstance(v, dict) or isinstance(v, list):
+                    continue
+                if k in source_item and v == source_item[k]:
+                    comparison = True
+                    continue
+                if k not in source_item:
+                    unique_dest = True
+                    continue
+                comparison = True
+                match = False
+            if comparison and match and not (unique_source and unique_dest):
+                reference_merge_dict(source_item, dest_item, merge_list_items)
+                return
+    elif source_item in destination:
+        return
+    destination.append(source_item)
+
+
+def reference_merge_dict(source, destination, merge_list_items=True):
+    if not source:
+        return destination
+    for key, value in source.items():
+        if isinstance(value, dict):
+            node = destination.setdefault(key, {})
+            if node is None:
+                destination[key] = value
+            else:
+                reference_merge_dict(value, node, merge_list_items)
+        elif isinstance(value, list):
+            if key not in destination:
+                destination[key] = value
+            if isinstance(destination[key], list):
+                for i in value:
+                    reference_merge_list_item(
+                        i, destination[key], merge_list_items)
+        else:
+            destination[key] = value
+    return destination
+
+
+def ordered(data):
+    """Representation that also tells key order and 1 from 1.0/True."""
+    if isinstance(data, dict):
+        return [(repr(k), ordered(v)) for k, v in data.items()]
+    if isinstance(data, list):
+        return [ordered(i) for i in data]
+    return repr(data)
+
+
+def assert_equivalent(documents, merge_list_items=True):
+    expected = {}
+    for document in copy.deepcopy(documents):
+        reference_merge_dict(document, expected, merge_list_items)
+    result = {}
+    for document in copy.deepcopy(documents):
+        yaml.merge_dict(document, result, merge_list_items)
+    assert ordered(result) == ordered(expected)
+
+    # Indexes shared across documents, as load_yaml_files does
+    shared = {}
+    indexes = yaml._MergeIndexes()
+    for document in copy.deepcopy(documents):
+        yaml._merge_dict(document, shared, merge_list_items, indexes)
+    assert ordered(shared) == ordered(expected)
+
+
+PRIMITIVE_KEYS = ["name", "id", "vlan", "descr"]
+PRIMITIVE_VALUES = ["a", "b", "c", 1, 1.0, True, 2, None]
+
+
+def random_item(rng, depth):
+    item = {}
+    keys = rng.sample(PRIMITIVE_KEYS, rng.randint(1, len(PRIMITIVE_KEYS)))
+    for key in keys:
+        item[key] = rng.choice(PRIMITIVE_VALUES)
+    if depth > 0 and rng.random() < 0.4:
+        item["children"] = random_items(rng, depth - 1)
+    if rng.random() < 0.3:
+        item["tags"] = [rng.choice(PRIMITIVE_VALUES)
+                        for _ in range(rng.randint(0, 3))]
+    if depth > 0 and rng.random() < 0.2:
+        item["cfg"] = random_document(rng, depth - 1)
+    return item
+
+
+def random_items(rng, depth):
+    return [random_item(rng, depth) for _ in range(rng.randint(0, 6))]
+
+
+def random_document(rng, depth):
+    document = {}
+    if rng.random() < 0.8:
+        document["items"] = random_items(rng, depth)
+    if rng.random() < 0.3:
+        document["tags"] = [rng.choice(PRIMITIVE_VALUES)
+                            for _ in range(rng.randint(0, 4))]
+    if rng.random() < 0.3:
+        document["descr"] = rng.choice(PRIMITIVE_VALUES)
+    if depth > 0 and rng.random() < 0.3:
+        document["cfg"] = random_document(rng, depth - 1)
+    return document
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_merge_random_corpus(seed):
+    rng = random.Random(seed)
+    documents = [random_document(rng, 2) for _ in range(rng.randint(1, 5))]
+    assert_equivalent(documents)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_merge_random_corpus_no_list_merge(seed):
+    rng = random.Random(seed)
+    documents = [random_document(rng, 2) for _ in range(rng.randint(1, 4))]
+    assert_equivalent(documents, merge_list_items=False)
+
+
+# A dict item in two lists, as YAML aliases make
+ALIASED = {"name": "a"}
+ALIASED_CFG = {"name": "c"}
+
+
+@pytest.mark.parametrize("documents", [
+    # same name, superset and subset of primitive keys
+    [{"l": [{"name": "a"}]}, {"l": [{"name": "a", "id": 1}]},
+     {"l": [{"name": "a"}]}],
+    # unique keys on both sides do not match
+    [{"l": [{"name": "a", "id": 1}]}, {"l": [{"name": "a", "vlan": 2}]}],
+    # first match in list order wins
+    [{"l": [{"name": "a", "id": 1}, {"name": "a", "id": 2}]},
+     {"l": [{"name": "a"}]}],
+    # primitive against container value does not match
+    [{"l": [{"name": "a", "x": [1]}]}, {"l": [{"name": "a", "x": 1}]}],
+    # merged item gains keys and is matched by them later on
+    [{"l": [{"name": "a"}, {"id": 1}]}, {"l": [{"name": "a", "id": 1}]},
+     {"l": [{"name": "a", "id": 1, "vlan": 3}]}],
+    # scalars, equal across types
+    [{"l": [1, "a", None]}, {"l": [True, 1.0, "a", "b", None]}],
+    # mixed lists fall back to the linear search
+    [{"l": [{"name": "a"}, "a"]}, {"l": [{"name": "a", "id": 1}, "a", "b"]}],
+    # unhashable and NaN values fall back to the linear search
+    [{"l": [{"name": {1, 2}}]}, {"l": [{"name": {1, 2}, "id": 1}]}],
+    [{"l": [{"name": "a", "id": 1}]}, {"l": [{"name": float("nan")}]},
+     {"l": [{"name": float("nan")}, {"name": "a"}]}],
+    # nested lists in matched items
+    [{"l": [{"name": "a", "c": [{"name": "x"}]}]},
+     {"l": [{"name": "a", "c": [{"name": "x", "id": 1}, {"name": "y"}]}]}],
+    # item shared by two lists, merged into through either of them
+    [{"x": ALIASED, "l": [ALIASED], "m": [ALIASED]},
+     {"m": [{"name": "a", "id": 1}]}, {"l": [{"name": "a", "vlan": 2}]}],
+    # nested dict of an item that is also an item of another list
+    [{"l": [{"name": "a", "cfg": ALIASED_CFG}], "m": [ALIASED_CFG]},
+     {"l": [{"name": "a", "cfg": {"id": 1}}]},
+     {"m": [{"name": "c", "vlan": 2}]}],
+    # item twice in one list
+    [{"l": [ALIASED, {"id": 1}, ALIASED]},
+     {"l": [{"name": "a", "id": 1}]}, {"l": [{"name": "a", "vlan": 2}]}],
+])
+def test_merge_cases(documents):
+    assert_equivalent(documents)
+
+
+def test_merge_list_item():
+    destination = [{"name": "a"}, {"name": "b", "id": 1}]
+    expected = copy.deepcopy(destination)
+    for item in [{"name": "b"}, {"name": "d"}, "c", "c", "e"]:
+        yaml.merge_list_item(copy.deepcopy(item), destination)
+        reference_merge_list_item(copy.deepcopy(item), expected)
+    assert ordered(destination) == ordered(expected)
+
+
+def test_merge_large_list():
+    count = 5000
+    documents = [
+        {"tenants": [{"name": "t", "epgs": [
+            {"name": "epg{}".format(i), "bd": "bd{}".format(i % 10)}
+            for i in range(count)
+        ]}]},
+        {"tenants": [{"name": "t", "epgs": [
+            {"name": "epg{}".format(i), "bd": "bd{}".format(i % 10),
+             "vlan": i}
+            for i in range(0, count, 2)
+        ]}]},
+    ]
+    result = {}
+    for document in documents:
+        yaml.merge_dict(document, result)
+    epgs = result["tenants"][0]["epgs"]
+    assert len(epgs) == count
+    assert epgs[10] == {"name": "epg10", "bd": "bd0", "vlan": 10}
+    assert "vlan" not in epgs[11]
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2024, Wang Xiao <xiawang3@cisco.com>
+
+import json
+import os
+
+import pytest
+
+import iac_init
+from iac_init.conf import settings
+from iac_init.yaml_conf import yaml_writer
+
+pytestmark = pytest.mark.unit
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+@pytest.mark.parametrize("text, lines", [
+    # A run of blank lines is kept as one before an unindented line
+    ("a\n\n\n\nb\n", ["a", "", "b"]),
+    ("\n\nb\n", ["", "b"]),
+    # and dropped before an indented one
+    ("a\n\n  \n\n  b\n", ["a", "  b"]),
+    # Trailing whitespace is kept, whitespace-only lines are blank
+    ("a:  \n  b: 1 \t\n", ["a:  ", "  b: 1 \t"]),
+    ("a\n  \n", ["a"]),
+    # The final newline makes no line, trailing blank lines are dropped
+    ("a\n\nb", ["a", "", "b"]),
+    ("a\n\n", ["a"]),
+    ("a", ["a"]),
+    ("", []),
+    ("a\r\n\r\nb\r\n", ["a", "", "b"]),
+])
+@pytest.mark.parametrize("split", [False, True])
+def test_clean_lines(text, lines, split):
+    # Streamed templates can split lines, and CRLF, across chunks
+    chunks = list(text) if split else [text]
+    assert list(yaml_writer._clean_lines(
+        yaml_writer._split_lines(chunks))) == lines
+
+
+def test_split_lines_crlf_across_chunks():
+    chunks = ["a\r", "\nb\r", "", "c\r"]
+    assert list(yaml_writer._split_lines(chunks)) == ["a", "b", "c"]
+
+
+def test_device_scripts(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "DEVICE_SCRIPTS", {
+        "01-step": [("role/templates/script{major}.exp.jinja2",
+                     "nodes", "files/script_{hostname}.exp")],
+    })
+    monkeypatch.setattr(settings, "TEMPLATE_BYTECODE_CACHE", False)
+    monkeypatch.setattr(settings, "YAML_DISK_CACHE", False)
+    fixtures = os.path.join(FIXTURES, "device_scripts")
+    writer = yaml_writer.YamlWriter([os.path.join(fixtures, "data.yml")])
+
+    writer.write(os.path.join(fixtures, "templates", "01-step"),
+                 str(tmp_path / "out"))
+
+    files = tmp_path / "out" / "01-step" / "files"
+    assert (files / "script_a.exp").read_text() == \
+        "set ip 10.0.0.1\nset port 23\nset gw \n"
+    assert (files / "script_b.exp").read_text() == \
+        "set ip 10.0.0.2\nset gw \n"
+    assert (files / "script_a.exp").stat().st_mode & 0o111 == 0o111
+
+
+def test_write_keeps_unchanged_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "TEMPLATE_BYTECODE_CACHE", False)
+    monkeypatch.setattr(settings, "YAML_DISK_CACHE", False)
+    templates = tmp_path / "templates" / "02-step"
+    templates.mkdir(parents=True)
+    (templates / "name.yml.j2").write_text("name: {{ fabric.name }}\n")
+    (templates / "vlan.yml.j2").write_text("vlan: {{ fabric.vlan }}\n")
+    data = tmp_path / "data.yml"
+    data.write_text("fabric: {name: a, vlan: 10}\n")
+    output = tmp_path / "out"
+    yaml_writer.YamlWriter([str(data)]).write(str(templates), str(output))
+    os.utime(output / "02-step" / "name.yml", ns=(0, 0))
+
+    data.write_text("fabric: {name: a, vlan: 20}\n")
+    yaml_writer.YamlWriter([str(data)]).write(str(templates), str(output))
+
+    assert (output / "02-step" / "vlan.yml").read_text() == "vlan: 20"
+    assert (output / "02-step" / "name.yml").stat().st_mtime_ns == 0
+    assert sorted(os.listdir(output / "02-step")) == \
+        ["name.yml", "vlan.yml"]
+
+
+def test_write_removes_stale_files_of_other_version(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "TEMPLATE_BYTECODE_CACHE", False)
+    monkeypatch.setattr(settings, "YAML_DISK_CACHE", False)
+    templates = tmp_path / "templates" / "02-step"
+    (templates / "vars").mkdir(parents=True)
+    (templates / "old.yml.j2").write_text("old: true\n")
+    (templates / "new.yml.j2").write_text("new: true\n")
+    data = tmp_path / "data.yml"
+    data.write_text("fabric: {}\n")
+    output = tmp_path / "out"
+    writer = yaml_writer.YamlWriter([str(data)])
+    writer.write(str(templates), str(output))
+    copied = output / "02-step" / "vars" / "main.yml"
+    copied.write_text("fabric: {}\n")
+    writer.track(str(output), str(copied))
+    manifest_path = output / ".manifest" / "02-step.json"
+    manifest = json.loads(manifest_path.read_text())
+    manifest_path.write_text(json.dumps(dict(manifest, version="0.0.0")))
+
+    (templates / "old.yml.j2").unlink()
+    writer.write(str(templates), str(output))
+
+    assert sorted(os.listdir(output / "02-step")) == ["new.yml", "vars"]
+    assert not copied.exists()
+
+
+def write_step(tmp_path):
+    """Write a one-template step and its data, returns (templates, data)."""
+    templates = tmp_path / "templates" / "02-step"
+    templates.mkdir(parents=True)
+    (templates / "name.yml.j2").write_text("name: {{ fabric.name }}\n")
+    data = tmp_path / "data.yml"
+    data.write_text("fabric: {name: a}\n")
+    return templates, data
+
+
+def test_write_cleans_step_without_manifest(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "TEMPLATE_BYTECODE_CACHE", False)
+    monkeypatch.setattr(settings, "YAML_DISK_CACHE", False)
+    templates, data = write_step(tmp_path)
+    output = tmp_path / "out"
+    (output / "02-step" / "old").mkdir(parents=True)
+    (output / "02-step" / "old" / "stale.yml").write_text("old: true\n")
+    (output / "iac_init_log").mkdir()
+
+    yaml_writer.YamlWriter([str(data)]).write(str(templates), str(output))
+
+    assert sorted(os.listdir(output / "02-step")) == ["name.yml"]
+    assert (output / "iac_init_log").is_dir()
+
+
+def test_write_keeps_files_outside_step(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "TEMPLATE_BYTECODE_CACHE", False)
+    monkeypatch.setattr(settings, "YAML_DISK_CACHE", False)
+    templates, data = write_step(tmp_path)
+    output = tmp_path / "out"
+    writer = yaml_writer.YamlWriter([str(data)])
+    writer.write(str(templates), str(output))
+    outside = tmp_path / "outside.yml"
+    outside.write_text("keep: true\n")
+    manifest_path = output / ".manifest" / "02-step.json"
+    manifest = json.loads(manifest_path.read_text())
+    manifest["files"][os.path.join("02-step", "..", "..", "outside.yml")] = \
+        {"key": None, "digest": ""}
+    manifest_path.write_text(json.dumps(manifest))
+
+    writer.write(str(templates), str(output))
+
+    assert outside.exists()
+
+
+def test_environments_cache_separately(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "TEMPLATE_BYTECODE_CACHE", True)
+    monkeypatch.setattr(settings, "CACHE_DIR", str(tmp_path / "cache"))
+    templates = tmp_path / "templates"
+    templates.mkdir()
+    # lstrip_blocks, only set for the YAML environment, applies at compile
+    # time
+    (templates / "t.j2").write_text(
+        "  {% if x %}\nx: {{ x }}\n  {% endif %}\n")
+
+    def render_twice(create):
+        return [create(str(templates)).get_template("t.j2").render(x=1)
+                for _ in range(2)]
+
+    yaml_outputs = render_twice(yaml_writer._create_environment)
+    script_outputs = render_twice(yaml_writer._create_script_environment)
+
+    assert yaml_outputs == ["x: 1\n"] * 2
+    assert script_outputs == ["  x: 1\n  "] * 2
+    assert sorted(os.listdir(
+        tmp_path / "cache" / "jinja" / iac_init.__version__)) == \
+        ["script", "yaml"]